@@ -1,32 +1,167 @@
-from dataclasses import dataclass
+import asyncio
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import statistics
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
 from typing import List, Dict, Any
 
+import httpx
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_ollama import ChatOllama
-from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.globals import set_llm_cache
+from pydantic import BaseModel
 
+# LLM cevap cache'i: aynı prompt tekrar geldiğinde Ollama çağrılmaz.
+# langchain-community kuruluysa cache çalıştırmalar arası diskte kalır.
+try:
+    from langchain_community.cache import SQLiteCache
+    set_llm_cache(SQLiteCache(database_path=".llm_cache.db"))
+except ImportError:
+    from langchain_core.caches import InMemoryCache
+    set_llm_cache(InMemoryCache())
 
-llm = ChatOllama(
-    model="qwen2.5:3b",
-    temperature=0
-)
+log = logging.getLogger("procurement.batch")
 
 
-@dataclass
+def setup_logging(level: int = logging.INFO) -> logging.handlers.QueueListener:
+    """
+    Log kayıtlarını kuyruğa yazar; stderr'e yazma işi arka plandaki
+    QueueListener thread'inde yapılır, eşzamanlı agent'lar I/O'da beklemez.
+    Dönen listener iş bitince stop() ile kapatılmalıdır.
+    """
+    log_queue = queue.SimpleQueue()
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(message)s"))
+
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    return listener
+
+
+# uvloop kuruluysa batch event loop'u onunla çalışır (daha düşük I/O overhead)
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+# Ollama'ya aynı anda gönderilecek en fazla istek sayısı; sunucudaki
+# paralel slot sayısıyla (OLLAMA_NUM_PARALLEL) aynı tutulur
+MAX_CONCURRENCY = int(os.environ.get("OLLAMA_NUM_PARALLEL", "8"))
+
+
+def bootstrap_ollama() -> ChatOllama:
+    """
+    Batch iş yükü için Ollama istemcisini hazırlar.
+
+    OLLAMA_NUM_PARALLEL ve OLLAMA_MAX_LOADED_MODELS sunucu (`ollama serve`)
+    tarafında okunur; çalışan bir sunucuyu etkilemek için sunucu başlatılmadan
+    önce export edilmelidir. Buradaki varsayılanlar yalnızca bu process'ten
+    başlatılan alt process'lere aktarılır.
+    """
+    os.environ.setdefault("OLLAMA_NUM_PARALLEL", str(MAX_CONCURRENCY))
+    os.environ.setdefault("OLLAMA_MAX_LOADED_MODELS", "1")
+
+    return ChatOllama(
+        model="qwen2.5:3b",
+        temperature=0,
+        format="json",      # Decode sırasında sadece geçerli JSON üretilir
+        num_ctx=1024,       # Prompt'lar kısa, küçük KV cache yeterli
+        num_predict=256,    # JSON çıktıları kısa; decode süresini sınırlar
+        keep_alive="10m",   # Emailler arasında model yeniden yüklenmesin
+        # Tüm istekler tek bir keep-alive bağlantı havuzunu paylaşır
+        client_kwargs={
+            "limits": httpx.Limits(
+                max_connections=16,
+                max_keepalive_connections=16,
+                keepalive_expiry=60
+            )
+        }
+    )
+
+
+llm = bootstrap_ollama()
+
+
+# Tek bir LLM çağrısı için timeout sınırları (saniye). İlk ölçümlerden sonra
+# timeout, o zincir için gözlenen medyan sürenin 1.5 katına ayarlanır; böylece
+# takılan bir istek tüm batch'i beklettirmez.
+LLM_TIMEOUT_MAX = float(os.environ.get("LLM_TIMEOUT", "30"))
+LLM_TIMEOUT_MIN = 5.0
+# Bundan hızlı dönen çağrılar LLM cache isabetidir; medyana katılmaz
+LLM_CACHE_HIT_MAX = 0.05
+
+# Süreler zincir başına tutulur: kısa extraction çağrıları, daha uzun
+# approval mail üretiminin timeout'unu düşürmez. Son 50 ölçüm yeterli.
+_llm_call_durations: Dict[int, deque] = defaultdict(lambda: deque(maxlen=50))
+
+
+def _llm_timeout(chain) -> float:
+    durations = _llm_call_durations[id(chain)]
+    if len(durations) < 3:
+        return LLM_TIMEOUT_MAX
+    adaptive = 1.5 * statistics.median(durations)
+    return min(LLM_TIMEOUT_MAX, max(LLM_TIMEOUT_MIN, adaptive))
+
+
+async def call_with_timeout(chain, inputs: Dict[str, Any], retries: int = 1):
+    """chain.ainvoke'u timeout ile çağırır; süre aşılırsa `retries` kez tekrar dener"""
+    for attempt in range(retries + 1):
+        timeout = _llm_timeout(chain)
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(chain.ainvoke(inputs), timeout=timeout)
+        except asyncio.TimeoutError:
+            if attempt == retries:
+                raise TimeoutError(
+                    f"LLM call timed out after {retries + 1} attempts ({timeout:.1f}s)")
+            log.warning(
+                "⏱️ LLM çağrısı %.1fs içinde dönmedi, tekrar deneniyor", timeout)
+            continue
+
+        elapsed = time.monotonic() - start
+        if elapsed > LLM_CACHE_HIT_MAX:
+            _llm_call_durations[id(chain)].append(elapsed)
+        return result
+
+
+@dataclass(slots=True, frozen=True)
 class PurchaseRequest:
     item: str
     quantity: int
     budget: float
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Supplier:
     name: str
     price_per_unit: float
     compliant: bool
 
 
-@dataclass
+@dataclass(slots=True)
+class Priced:
+    """Bir request ile seçilen tedarikçi; toplam maliyet bir kez hesaplanır"""
+    request: PurchaseRequest
+    supplier: Supplier
+    total: float = field(init=False)
+
+    def __post_init__(self):
+        self.total = self.supplier.price_per_unit * self.request.quantity
+
+
+@dataclass(slots=True, frozen=True)
 class EvaluationResult:
     email_id: int
     status: str
@@ -35,85 +170,148 @@ class EvaluationResult:
     approval_email: Dict[str, Any] | None = None  # 👈 BURAYI EKLE
 
 
-email_prompt = ChatPromptTemplate.from_messages([
-    ("system",
-     "You extract a structured purchase request from an email. "
-     "Return ONLY valid JSON with keys: item, quantity, budget.\n"
-     "quantity MUST be a single integer number.\n"
-     "budget MUST be a single float number.\n"
-     "Example: {{\"item\": \"laptop\", \"quantity\": 5, \"budget\": 50000.0}}"),
-    ("human", "{email}")
-])
+# =========================
+# LLM OUTPUT SCHEMAS
+# =========================
+class PurchaseRequestModel(BaseModel):
+    item: str
+    quantity: int
+    budget: float
 
-email_parser = JsonOutputParser()
 
+class SupplierModel(BaseModel):
+    name: str = "Unknown Supplier"
+    price_per_unit: float
+    compliant: bool = False
 
-def email_agent(email_text: str) -> PurchaseRequest:
-    print("📨 EmailAgent (LLM) çalıştı")
 
-    chain = email_prompt | llm | email_parser
-    data = chain.invoke({"email": email_text})
+class ProcurementModel(BaseModel):
+    request: PurchaseRequestModel
+    supplier: SupplierModel
 
-    return PurchaseRequest(
-        item=data["item"],
-        quantity=int(data["quantity"]),
-        budget=float(data["budget"])
-    )
 
+class ApprovalEmailModel(BaseModel):
+    subject: str
+    body: str
+    manager_email: str
 
-supplier_prompt = ChatPromptTemplate.from_messages([
+
+# Email extraction ve tedarikçi önerisi tek LLM çağrısında yapılır:
+# iki ayrı round-trip ve prefill yerine tek istek
+procurement_prompt = ChatPromptTemplate.from_messages([
     ("system",
-     "You MUST return valid JSON.\n"
-     "price_per_unit MUST be a number.\n"
+     "You extract a structured purchase request from an email "
+     "and propose one supplier for it.\n"
+     "Return ONLY valid JSON with keys: request, supplier.\n"
+     "request has keys: item, quantity, budget.\n"
+     "quantity MUST be a single integer number.\n"
+     "budget MUST be a single float number.\n"
+     "supplier has keys: name, price_per_unit, compliant.\n"
+     "price_per_unit MUST be a number. "
      "If unsure, estimate a realistic price.\n"
-     "JSON schema:\n"
+     "compliant MUST be a boolean.\n"
+     "Example:\n"
      "{{\n"
-     '  "name": string,\n'
-     '  "price_per_unit": number,\n'
-     '  "compliant": boolean\n'
+     '  "request": {{"item": "laptop", "quantity": 5, "budget": 50000.0}},\n'
+     '  "supplier": {{"name": "TechSupply", "price_per_unit": 9500.0, "compliant": true}}\n'
      "}}"),
-    ("human",
-     "Item: {item}\nQuantity: {quantity}\nBudget: {budget}")
+    ("human", "{email}")
 ])
 
-supplier_parser = JsonOutputParser()
+procurement_parser = PydanticOutputParser(pydantic_object=ProcurementModel)
 
+procurement_chain = procurement_prompt | llm | procurement_parser
 
-def supplier_agent(request: PurchaseRequest) -> Supplier:
-    print("🏭 SupplierAgent (LLM) çalıştı")
 
-    chain = supplier_prompt | llm | supplier_parser
-    data = chain.invoke({
-        "item": request.item,
-        "quantity": request.quantity,
-        "budget": request.budget
-    })
+def _to_priced(data: ProcurementModel) -> Priced:
+    return Priced(
+        request=PurchaseRequest(**data.request.model_dump()),
+        supplier=Supplier(**data.supplier.model_dump())
+    )
+
+
+async def procurement_agent_batch(
+    emails: List[str]
+) -> List[Priced | Exception]:
+    """
+    Tüm emailler için purchase request + tedarikçiyi eşzamanlı olarak çıkarır.
+    Başarısız olan emailler için listede Exception döner.
+    """
+    log.info(
+        "📨 Email + 🏭 Supplier Agent (LLM) batch çalıştı - %d email", len(emails))
+
+    # Aynı email birden fazla kez geldiyse LLM'e sadece bir kez gönderilir
+    unique_emails = list(dict.fromkeys(emails))
 
-    price = data.get("price_per_unit")
+    # abatch gibi en fazla MAX_CONCURRENCY istek, ama her biri kendi timeout'u ile
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
 
-    # 🔥 FAIL-SAFE
-    if price is None:
-        raise ValueError("SupplierAgent returned null price_per_unit")
+    async def extract(email: str):
+        async with semaphore:
+            return await call_with_timeout(procurement_chain, {"email": email})
 
-    return Supplier(
-        name=data.get("name", "Unknown Supplier"),
-        price_per_unit=float(price),
-        compliant=bool(data.get("compliant", False))
+    outputs = await asyncio.gather(
+        *(extract(email) for email in unique_emails),
+        return_exceptions=True
     )
 
+    results_by_email = {}
+    for email, data in zip(unique_emails, outputs):
+        if isinstance(data, Exception):
+            results_by_email[email] = data
+            continue
+        try:
+            results_by_email[email] = _to_priced(data)
+        except Exception as e:
+            results_by_email[email] = e
+
+    return [results_by_email[email] for email in emails]
+
+
+# Ürün başına gerçekçi en düşük birim fiyat (TL). Bütçe bunun altındaysa
+# istek karşılanamaz; approval maili için LLM çağrısı yapılmaz.
+MIN_UNIT_PRICE = {
+    "laptop": 5000,
+    "telefon": 1000,
+    "phone": 1000,
+    "iphone": 30000,
+    "sunucu": 20000,
+    "server": 20000,
+    "araba": 500000,
+    "car": 500000,
+}
+
+
+def is_budget_feasible(request: PurchaseRequest) -> bool:
+    words = request.item.lower().split()
+    if not words:
+        return True
+    min_price = MIN_UNIT_PRICE.get(words[0], 0)
+    return request.budget >= min_price * request.quantity
 
-def compliance_agent(supplier: Supplier, request: PurchaseRequest) -> tuple[bool, str]:
-    print("📋 ComplianceAgent çalıştı")
 
-    total_cost = supplier.price_per_unit * request.quantity
+def compliance_agent_batch(batch: List[Priced]) -> List[tuple[bool, str]]:
+    """
+    Tüm emaillerin compliance kontrolünü LLM fazından sonra tek geçişte yapar.
+    Sonuçlar girdi sırasıyla (is_compliant, reason) olarak döner.
+    """
+    log.info("📋 ComplianceAgent batch çalıştı - %d request", len(batch))
 
-    if not supplier.compliant:
-        return False, "Supplier is not compliant"
+    totals = [priced.total for priced in batch]
+    budgets = [priced.request.budget for priced in batch]
+    compliant = [priced.supplier.compliant for priced in batch]
 
-    if total_cost > request.budget:
-        return False, f"Budget exceeded: {total_cost} > {request.budget}"
+    results = []
+    for total_cost, budget, is_compliant in zip(totals, budgets, compliant):
+        if not is_compliant:
+            results.append((False, "Supplier is not compliant"))
+        elif total_cost > budget:
+            results.append(
+                (False, f"Budget exceeded: {total_cost} > {budget}"))
+        else:
+            results.append((True, ""))
 
-    return True, ""  # 👈 BU SATIR VAR MI?
+    return results
 
 
 approval_prompt = ChatPromptTemplate.from_messages([
@@ -137,26 +335,31 @@ approval_prompt = ChatPromptTemplate.from_messages([
      "Reason: {reason}")
 ])
 
-approval_parser = JsonOutputParser()
+approval_parser = PydanticOutputParser(pydantic_object=ApprovalEmailModel)
+
+approval_chain = approval_prompt | llm | approval_parser
 
 
-def approval_agent(request: PurchaseRequest, supplier: Supplier, reason: str) -> Dict[str, Any]:
-    print("📧 ApprovalAgent (LLM) çalıştı - Manager'a mail hazırlanıyor")
+async def approval_agent(priced: Priced, reason: str) -> Dict[str, Any]:
+    log.info("📧 ApprovalAgent (LLM) çalıştı - Manager'a mail hazırlanıyor")
 
-    total = supplier.price_per_unit * request.quantity
+    request, supplier = priced.request, priced.supplier
 
-    chain = approval_prompt | llm | approval_parser
-    email_data = chain.invoke({
+    email_data = await call_with_timeout(approval_chain, {
         "item": request.item,
         "quantity": request.quantity,
         "supplier": supplier.name,
         "price": supplier.price_per_unit,
-        "total": total,
+        "total": priced.total,
         "budget": request.budget,
         "reason": reason
     })
 
-    return email_data
+    return email_data.model_dump()
+
+
+# Simülasyon için sabit seed'li RNG: batch çalıştırmaları tekrarlanabilir olur
+_approval_rng = random.Random(0xC0FFEE)
 
 
 def simulate_manager_approval() -> bool:
@@ -164,93 +367,147 @@ def simulate_manager_approval() -> bool:
     Gerçek sistemde manager'dan cevap bekler
     Şimdilik simüle ediyoruz
     """
-    import random
     # %70 ihtimalle onaylansın
-    approved = random.random() < 0.7
+    approved = _approval_rng.random() < 0.7
 
     if approved:
-        print("   ✅ Manager onayladı (simulated)")
+        log.info("   ✅ Manager onayladı (simulated)")
     else:
-        print("   ❌ Manager reddetti (simulated)")
+        log.info("   ❌ Manager reddetti (simulated)")
 
     return approved
 
 
-def order_agent(supplier: Supplier, request: PurchaseRequest) -> Dict[str, Any]:
-    print("🧾 OrderAgent çalıştı")
+def order_agent(priced: Priced) -> Dict[str, Any]:
+    log.info("🧾 OrderAgent çalıştı")
 
     return {
-        "supplier": supplier.name,
-        "item": request.item,
-        "quantity": request.quantity,
-        "total_price": supplier.price_per_unit * request.quantity,
+        "supplier": priced.supplier.name,
+        "item": priced.request.item,
+        "quantity": priced.request.quantity,
+        "total_price": priced.total,
         "status": "ORDER_PLACED"
     }
 
 
-def orchestrator_batch(emails: List[str]) -> List[EvaluationResult]:
-    results = []
+def _error_result(idx: int, error: BaseException) -> EvaluationResult:
+    log.error("🔥 Email #%d Hata: %s", idx, error)
+    return EvaluationResult(
+        email_id=idx,
+        status="ERROR",
+        reason=str(error),
+        order=None
+    )
 
-    print("\n🚀 Batch Orchestrator başladı\n")
 
-    for idx, email in enumerate(emails, start=1):
-        print(f"\n--- ✉️ Email #{idx} ---")
+async def finalize_email(
+    idx: int,
+    priced: Priced,
+    compliance: tuple[bool, str]
+) -> EvaluationResult:
+    """
+    Compliance sonucu belli olan tek email için (approval) → order.
+    Approval LLM çağrıları emailler arasında eşzamanlı çalışır.
+    """
+    log.info("--- ✉️ Email #%d ---", idx)
+
+    try:
+        is_compliant, compliance_reason = compliance
+
+        # Eğer compliance fail → Approval gerekli
+        if not is_compliant:
+            # Bütçe ürün için imkansızsa approval'a hiç gitmeden reddedilir
+            request = priced.request
+            if not is_budget_feasible(request):
+                log.info("❌ Email #%d Bütçe bu ürün için imkansız", idx)
+                return EvaluationResult(
+                    email_id=idx,
+                    status="REJECTED_BUDGET_IMPOSSIBLE",
+                    reason=f"Budget impossible: {request.budget} for "
+                           f"{request.quantity} x {request.item}",
+                    order=None
+                )
+
+            log.warning("⚠️  Email #%d Compliance Issue: %s",
+                        idx, compliance_reason)
+            log.info("📧 Approval süreci başlatılıyor...")
+
+            # Approval maili oluştur
+            approval_email = await approval_agent(
+                priced, compliance_reason)
+
+            # Manager'dan onay bekle (simulated)
+            manager_approved = simulate_manager_approval()
+
+            if not manager_approved:
+                # Manager reddetti
+                log.info("❌ Email #%d Manager tarafından reddedildi", idx)
+                return EvaluationResult(
+                    email_id=idx,
+                    status="REJECTED_BY_MANAGER",
+                    reason="Manager did not approve the request",
+                    order=None,
+                    approval_email=approval_email
+                )
+
+            # Manager onayladı, devam et
+            log.info("✅ Manager onayı alındı, sipariş veriliyor...")
+
+        order = order_agent(priced)
+        log.info("✅ Email #%d Başarılı", idx)
+
+        return EvaluationResult(
+            email_id=idx,
+            status="SUCCESS",
+            reason=None,
+            order=order
+        )
+
+    except Exception as e:
+        return _error_result(idx, e)
+
+
+async def _run_batch(emails: List[str]) -> List[EvaluationResult]:
+    results: Dict[int, EvaluationResult] = {}
+
+    # 1️⃣ Batch extract: purchase request + tedarikçi, tüm emailler eşzamanlı
+    extracted = await procurement_agent_batch(emails)
+
+    valid = []
+    for idx, outcome in enumerate(extracted, start=1):
+        if isinstance(outcome, Exception):
+            results[idx] = _error_result(idx, outcome)
+        else:
+            valid.append((idx, outcome))
+
+    # 2️⃣ Batch compliance: saf CPU işi, LLM fazından ayrı tek geçişte
+    compliance = compliance_agent_batch([priced for _, priced in valid])
+
+    # 3️⃣ Email başına approval / order
+    tasks = []
+    for (idx, priced), check in zip(valid, compliance):
+        tasks.append((idx, finalize_email(idx, priced, check)))
+
+    outcomes = await asyncio.gather(
+        *(task for _, task in tasks), return_exceptions=True)
+
+    for (idx, _), outcome in zip(tasks, outcomes):
+        if isinstance(outcome, BaseException):
+            outcome = _error_result(idx, outcome)
+        results[idx] = outcome
+
+    return [results[idx] for idx in sorted(results)]
 
-        try:
-            request = email_agent(email)
-            supplier = supplier_agent(request)
-
-            # 3️⃣ Compliance kontrolü
-            is_compliant, compliance_reason = compliance_agent(
-                supplier, request)
-
-            # 4️⃣ Eğer compliance fail → Approval gerekli
-            if not is_compliant:
-                print(f"⚠️  Compliance Issue: {compliance_reason}")
-                print("📧 Approval süreci başlatılıyor...")
-
-                # Approval maili oluştur
-                approval_email = approval_agent(
-                    request, supplier, compliance_reason)
-
-                # Manager'dan onay bekle (simulated)
-                manager_approved = simulate_manager_approval()
-
-                if not manager_approved:
-                    # Manager reddetti
-                    results.append(EvaluationResult(
-                        email_id=idx,
-                        status="REJECTED_BY_MANAGER",
-                        reason="Manager did not approve the request",
-                        order=None,
-                        approval_email=approval_email
-                    ))
-                    print("❌ Manager tarafından reddedildi")
-                    continue
-
-                # Manager onayladı, devam et
-                print("✅ Manager onayı alındı, sipariş veriliyor...")
-
-            order = order_agent(supplier, request)
-
-            results.append(EvaluationResult(
-                email_id=idx,
-                status="SUCCESS",
-                reason=None,
-                order=order
-            ))
-            print("✅ Başarılı")
 
-        except Exception as e:
-            results.append(EvaluationResult(
-                email_id=idx,
-                status="ERROR",
-                reason=str(e),
-                order=None
-            ))
-            print("🔥 Hata:", e)
+def orchestrator_batch(emails: List[str]) -> List[EvaluationResult]:
+    log.info("🚀 Batch Orchestrator başladı")
 
-    return results
+    # Ollama çağrıları I/O-bound: extraction + supplier adımı tüm emailler
+    # için eşzamanlı gönderilir, sunucu bunları OLLAMA_NUM_PARALLEL
+    # ölçüsünde birlikte işler
+    if uvloop is not None:
+        return uvloop.run(_run_batch(emails))
+    return asyncio.run(_run_batch(emails))
 
 
 def evaluate_results(results: List[EvaluationResult]):
@@ -312,5 +569,10 @@ if __name__ == "__main__":
 
     print(f"📧 Toplam email sayısı: {len(incoming_emails)}")  # Bu 6 göstermeli
 
-    results = orchestrator_batch(incoming_emails)
+    listener = setup_logging()
+    try:
+        results = orchestrator_batch(incoming_emails)
+    finally:
+        listener.stop()
+
     evaluate_results(results)
@@ -0,0 +1,99 @@
+# models.py
+# Procurement data models and mock inbox shared by the Streamlit app and the orchestrator
+#
+# Kept outside the Streamlit script: Streamlit re-executes the script as a new
+# __main__ on every rerun, so classes defined there can't be pickled or cached
+# across reruns.
+
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass(frozen=True, slots=True)
+class Email:
+    id: int
+    sender: str
+    subject: str
+    body: str
+    category: str
+    priority: str
+
+
+@dataclass(frozen=True, slots=True)
+class PurchaseRequest:
+    item: str
+    quantity: int
+    budget: float
+
+
+@dataclass(frozen=True, slots=True)
+class Supplier:
+    name: str
+    price_per_unit: float
+    compliant: bool
+
+
+@dataclass
+class SupplierPool:
+    """Supplier options as parallel arrays - index i is one supplier"""
+    names: np.ndarray
+    prices: np.ndarray
+    compliant: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def totals(self, quantity: int) -> np.ndarray:
+        return self.prices * quantity
+
+    def eligible(self, request: PurchaseRequest) -> np.ndarray:
+        """Compliant and within budget, for all suppliers in one pass"""
+        return self.compliant & (self.totals(request.quantity) <= request.budget)
+
+    def supplier(self, idx: int) -> Supplier:
+        """Materialize only the chosen supplier for the rest of the workflow"""
+        return Supplier(str(self.names[idx]), float(self.prices[idx]), bool(self.compliant[idx]))
+
+
+# =========================
+# MOCK DATA
+# =========================
+MOCK_EMAILS = [
+    Email(
+        id=1,
+        sender="Cassie Matthews",
+        subject="Urgent: Branded Water Bottles Needed",
+        body="Hi, we need 300 branded water bottles for the upcoming conference. Budget is 15000 TL. Please process ASAP.",
+        category="Procurement Request",
+        priority="High"
+    ),
+    Email(
+        id=2,
+        sender="John Smith",
+        subject="Office Supplies Request",
+        body="Please order 50 notebooks and 100 pens. Budget: 2000 TL.",
+        category="Procurement Request",
+        priority="Medium"
+    ),
+    Email(
+        id=3,
+        sender="Sarah Connor",
+        subject="Meeting Room Update",
+        body="The meeting room schedule has been updated.",
+        category="General",
+        priority="Low"
+    ),
+    Email(
+        id=4,
+        sender="Mike Johnson",
+        subject="Laptop Purchase Request",
+        body="Need 10 laptops for new employees. Budget is 80000 TL.",
+        category="Procurement Request",
+        priority="High"
+    ),
+]
+
+# Computed once at import, not on every Streamlit rerun
+PROCUREMENT_EMAILS = tuple(
+    e for e in MOCK_EMAILS if e.category == "Procurement Request")
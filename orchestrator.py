@@ -2,12 +2,16 @@
 # IBM watsonx Orchestrate-style Orchestrator
 
 from dataclasses import dataclass
-from typing import Dict, Any, List, Callable
+from typing import Dict, Any, List, Callable, Iterable, Iterator, NamedTuple
 from enum import Enum
+import logging
 import time
 from datetime import datetime
 
 
+logger = logging.getLogger(__name__)
+
+
 class WorkflowStatus(Enum):
     """Workflow execution statuses"""
     PENDING = "pending"
@@ -25,7 +29,7 @@ class AgentStatus(Enum):
     FAILED = "failed"
 
 
-@dataclass
+@dataclass(slots=True)
 class AgentResult:
     """Result from an agent execution"""
     agent_name: str
@@ -35,7 +39,16 @@ class AgentResult:
     execution_time: float = 0.0
 
 
-@dataclass
+class LogEntry(NamedTuple):
+    """Single execution log record for an agent run"""
+    timestamp: str
+    agent: str
+    status: str
+    execution_time: float  # seconds
+    error: str = None
+
+
+@dataclass(slots=True)
 class WorkflowContext:
     """Shared context passed between agents"""
     email_id: int
@@ -50,13 +63,41 @@ class WorkflowContext:
     # Metadata
     workflow_status: WorkflowStatus = WorkflowStatus.PENDING
     current_step: str = None
-    execution_log: List[Dict] = None
+    execution_log: List[LogEntry] = None
 
     def __post_init__(self):
         if self.execution_log is None:
             self.execution_log = []
 
 
+def coalesce_stream(
+    chunks: Iterable[str],
+    interval: float = 0.2,
+    max_chunks: int = 32
+) -> Iterator[str]:
+    """
+    Coalesce a token stream into larger pieces for the UI
+
+    Yields the buffered text every `interval` seconds or every
+    `max_chunks` chunks, whichever comes first, then flushes the rest.
+    Each piece is one redraw in st.write_stream instead of one per token.
+    """
+    buffer: List[str] = []
+    last_flush = time.monotonic()
+
+    for chunk in chunks:
+        buffer.append(chunk)
+        now = time.monotonic()
+
+        if len(buffer) >= max_chunks or now - last_flush >= interval:
+            yield "".join(buffer)
+            buffer.clear()
+            last_flush = now
+
+    if buffer:
+        yield "".join(buffer)
+
+
 class ProcurementOrchestrator:
     """
     IBM watsonx Orchestrate-inspired orchestrator
@@ -76,8 +117,12 @@ class ProcurementOrchestrator:
             "order_agent"
         ]
 
-        # Execution history
+        # Execution history (+ index by email id for status lookups)
         self.execution_history: List[WorkflowContext] = []
+        self._history_by_id: Dict[int, WorkflowContext] = {}
+
+        # Log timestamps are monotonic offsets from orchestrator start
+        self._t0 = time.monotonic()
 
     def register_agent(self, name: str, agent_func: Callable):
         """Register an agent with the orchestrator"""
@@ -85,9 +130,13 @@ class ProcurementOrchestrator:
         self._log(f"Agent registered: {name}")
 
     def _log(self, message: str, level: str = "INFO"):
-        """Internal logging"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        print(f"[{timestamp}] [{level}] Orchestrator: {message}")
+        """Internal logging (formatted lazily by the logging module)"""
+        logger.log(
+            logging.getLevelName(level),
+            "[%7.3fs] Orchestrator: %s",
+            time.monotonic() - self._t0,
+            message
+        )
 
     def _execute_agent(
         self,
@@ -108,21 +157,21 @@ class ProcurementOrchestrator:
         self._log(f"Executing agent: {agent_name}")
         context.current_step = agent_name
 
-        start_time = time.time()
+        start_time = time.monotonic()
 
         try:
             agent_func = self.agents[agent_name]
             result_data = agent_func(context, **kwargs)
 
-            execution_time = time.time() - start_time
+            execution_time = time.monotonic() - start_time
 
             # Log execution
-            context.execution_log.append({
-                'timestamp': datetime.now().strftime("%H:%M:%S"),
-                'agent': agent_name,
-                'status': 'success',
-                'execution_time': f"{execution_time:.2f}s"
-            })
+            context.execution_log.append(LogEntry(
+                timestamp=datetime.now().strftime("%H:%M:%S"),
+                agent=agent_name,
+                status='success',
+                execution_time=execution_time
+            ))
 
             self._log(
                 f"Agent '{agent_name}' completed in {execution_time:.2f}s")
@@ -135,18 +184,18 @@ class ProcurementOrchestrator:
             )
 
         except Exception as e:
-            execution_time = time.time() - start_time
+            execution_time = time.monotonic() - start_time
 
             error_msg = f"Agent '{agent_name}' failed: {str(e)}"
             self._log(error_msg, level="ERROR")
 
-            context.execution_log.append({
-                'timestamp': datetime.now().strftime("%H:%M:%S"),
-                'agent': agent_name,
-                'status': 'failed',
-                'error': str(e),
-                'execution_time': f"{execution_time:.2f}s"
-            })
+            context.execution_log.append(LogEntry(
+                timestamp=datetime.now().strftime("%H:%M:%S"),
+                agent=agent_name,
+                status='failed',
+                execution_time=execution_time,
+                error=str(e)
+            ))
 
             return AgentResult(
                 agent_name=agent_name,
@@ -202,27 +251,47 @@ class ProcurementOrchestrator:
 
         context.suppliers = result.data
 
-        # Step 2.5: Wait for user to select supplier (if not provided)
-        if user_selections and 'selected_supplier' in user_selections:
-            context.selected_supplier = user_selections['selected_supplier']
-        else:
-            # In interactive mode, workflow pauses here
-            context.workflow_status = WorkflowStatus.PENDING
-            self._log("Workflow paused: Awaiting supplier selection")
-            return context
+        return self._continue_from(context, 'supplier_agent', user_selections)
 
-        # Step 3: Compliance Agent - Check compliance
-        result = self._execute_agent('compliance_agent', context)
+    def _continue_from(
+        self,
+        context: WorkflowContext,
+        step: str,
+        user_selections: Dict[str, Any] = None
+    ) -> WorkflowContext:
+        """
+        Run the workflow from the step after `step`
 
-        if result.status == AgentStatus.FAILED:
-            context.workflow_status = WorkflowStatus.FAILED
-            return context
+        Results of earlier steps (purchase request, suppliers, approval
+        email) are reused from the context instead of being recomputed.
+        """
+        user_selections = user_selections or {}
+
+        if step == 'supplier_agent':
+            # Step 2.5: Wait for user to select supplier (if not provided)
+            if 'selected_supplier' in user_selections:
+                context.selected_supplier = user_selections['selected_supplier']
+
+            if context.selected_supplier is None:
+                # In interactive mode, workflow pauses here
+                context.workflow_status = WorkflowStatus.PENDING
+                self._log("Workflow paused: Awaiting supplier selection")
+                return context
 
-        context.compliance_result = result.data
-        is_compliant, reason = result.data
+            # Step 3: Compliance Agent - Check compliance
+            result = self._execute_agent('compliance_agent', context)
 
-        # Step 4: Conditional - Approval if non-compliant
-        if not is_compliant:
+            if result.status == AgentStatus.FAILED:
+                context.workflow_status = WorkflowStatus.FAILED
+                return context
+
+            context.compliance_result = result.data
+            is_compliant, reason = result.data
+
+            if is_compliant:
+                return self._place_order(context)
+
+            # Step 4: Conditional - Approval if non-compliant
             context.workflow_status = WorkflowStatus.REQUIRES_APPROVAL
 
             result = self._execute_agent(
@@ -233,16 +302,30 @@ class ProcurementOrchestrator:
                 return context
 
             context.approval_email = result.data
+            step = 'approval_agent'
 
+        if step == 'approval_agent':
             # Wait for manager approval (would be async in production)
-            self._log("Workflow paused: Awaiting manager approval")
+            manager_approved = user_selections.get('manager_approved')
 
-            if user_selections and user_selections.get('manager_approved') == False:
+            if manager_approved is None:
+                context.workflow_status = WorkflowStatus.REQUIRES_APPROVAL
+                self._log("Workflow paused: Awaiting manager approval")
+                return context
+
+            if not manager_approved:
                 context.workflow_status = WorkflowStatus.FAILED
                 self._log("Workflow terminated: Manager rejected")
                 return context
 
-        # Step 5: Order Agent - Place order
+            return self._place_order(context)
+
+        raise ValueError(f"Cannot continue workflow from step '{step}'")
+
+    def _place_order(self, context: WorkflowContext) -> WorkflowContext:
+        """Step 5: Order Agent - Place order and finish the workflow"""
+        context.workflow_status = WorkflowStatus.IN_PROGRESS
+
         result = self._execute_agent('order_agent', context)
 
         if result.status == AgentStatus.FAILED:
@@ -258,15 +341,13 @@ class ProcurementOrchestrator:
 
         # Store in history
         self.execution_history.append(context)
+        self._history_by_id.setdefault(context.email_id, context)
 
         return context
 
     def get_workflow_status(self, email_id: int) -> WorkflowContext:
         """Get current workflow status for an email"""
-        for workflow in self.execution_history:
-            if workflow.email_id == email_id:
-                return workflow
-        return None
+        return self._history_by_id.get(email_id)
 
     def resume_workflow(
         self,
@@ -276,32 +357,39 @@ class ProcurementOrchestrator:
         """
         Resume a paused workflow with user input
 
-        Used when workflow needs user decisions (supplier selection, approval)
+        Used when workflow needs user decisions (supplier selection, approval).
+        Continues from the paused step; agents that already ran are not
+        executed again.
         """
 
         self._log(f"Resuming workflow for email #{context.email_id}")
 
-        # Update context with user input
-        if 'selected_supplier' in user_input:
-            context.selected_supplier = user_input['selected_supplier']
+        paused = context.workflow_status in (
+            WorkflowStatus.PENDING,
+            WorkflowStatus.REQUIRES_APPROVAL
+        )
+
+        if not paused or context.suppliers is None:
+            # Nothing to resume from: run the workflow from scratch
+            return self.execute_workflow(
+                context.email_data,
+                user_selections=user_input
+            )
 
-        if 'manager_approved' in user_input:
-            # Continue from approval step
-            pass
+        # A (new) supplier selection restarts from compliance
+        if 'selected_supplier' in user_input:
+            step = 'supplier_agent'
+        else:
+            step = context.current_step
 
-        # Re-execute workflow from current step
-        return self.execute_workflow(
-            context.email_data,
-            user_selections=user_input
-        )
+        context.workflow_status = WorkflowStatus.IN_PROGRESS
+        return self._continue_from(context, step, user_input)
 
     def get_execution_summary(self, context: WorkflowContext) -> Dict[str, Any]:
         """Generate execution summary"""
 
         total_time = sum(
-            float(log['execution_time'].rstrip('s'))
-            for log in context.execution_log
-            if 'execution_time' in log
+            log.execution_time for log in context.execution_log
         )
 
         return {
@@ -321,6 +409,9 @@ class ProcurementOrchestrator:
 
 if __name__ == "__main__":
 
+    logging.basicConfig(level=logging.INFO,
+                        format="[%(levelname)s] %(message)s")
+
     # Initialize orchestrator
     orchestrator = ProcurementOrchestrator()
 
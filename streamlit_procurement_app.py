@@ -1,11 +1,28 @@
 import streamlit as st
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+import zlib
 from dataclasses import dataclass
+from datetime import datetime, timedelta
 from typing import List, Dict, Any
-import time
+import numpy as np
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_ollama import ChatOllama
-from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import BaseOutputParser, StrOutputParser
+from pydantic import BaseModel
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 # 🆕 Import orchestrator
 try:
@@ -37,12 +54,12 @@ if 'selected_supplier' not in st.session_state:
     st.session_state.selected_supplier = None
 if 'approval_email' not in st.session_state:
     st.session_state.approval_email = None
-if 'history' not in st.session_state:
-    st.session_state.history = []
-if 'scheduled_reminders' not in st.session_state:
-    st.session_state.scheduled_reminders = []
+if 'history_page' not in st.session_state:
+    st.session_state.history_page = 0
 if 'workflow_context' not in st.session_state:
     st.session_state.workflow_context = None
+if 'extracted_requests' not in st.session_state:
+    st.session_state.extracted_requests = {}
 if 'orchestrator' not in st.session_state:
     st.session_state.orchestrator = initialize_orchestrator(
     ) if ORCHESTRATOR_AVAILABLE else None
@@ -54,16 +71,78 @@ if 'orchestrator' not in st.session_state:
 # =========================
 # HISTORY HELPER
 # =========================
+DB_PATH = os.environ.get("PROCUREMENT_DB", ".procurement_history.db")
+HISTORY_PAGE_SIZE = 50
+_SID_RE = re.compile(r"[0-9a-f]{32}")
+
+
+@st.cache_resource
+def get_db() -> sqlite3.Connection:
+    """Append-only store for history and reminders, opened once per process"""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS history "
+        "(timestamp TEXT, action TEXT, details TEXT, status TEXT, session TEXT)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS reminders "
+        "(recipient TEXT, subject TEXT, scheduled_time TEXT, interval TEXT, status TEXT, "
+        "session TEXT)")
+    for table in ("history", "reminders"):
+        # Databases created before rows were scoped per session
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if "session" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN session TEXT")
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_session ON {table} (session)")
+    conn.commit()
+    return conn
+
+
+@st.cache_resource
+def get_db_lock() -> threading.Lock:
+    """The connection is shared by every session thread; sqlite3 needs callers to serialize"""
+    return threading.Lock()
+
+
+def session_id() -> str:
+    """Per-browser-session id kept in ?sid= so history survives a refresh"""
+    sid = st.query_params.get("sid")
+    if not sid or not _SID_RE.fullmatch(sid):
+        sid = uuid.uuid4().hex
+        st.query_params["sid"] = sid
+    return sid
+
+
 def add_history(action: str, details: str, status: str = "success"):
     """Add event to history with timestamp"""
-    from datetime import datetime
+    conn = get_db()
+    with get_db_lock(), conn:
+        conn.execute(
+            "INSERT INTO history VALUES (?, ?, ?, ?, ?)",
+            (datetime.now().time().isoformat(timespec='seconds'), action, details, status,
+             session_id()))
+
+
+def history_count() -> int:
+    with get_db_lock():
+        return get_db().execute(
+            "SELECT COUNT(*) FROM history WHERE session = ?",
+            (session_id(),)).fetchone()[0]
 
-    st.session_state.history.append({
-        'timestamp': datetime.now().strftime("%H:%M:%S"),
-        'action': action,
-        'details': details,
-        'status': status
-    })
+
+def load_history_page(page: int) -> List[tuple]:
+    """Newest first, HISTORY_PAGE_SIZE rows per page"""
+    with get_db_lock():
+        return get_db().execute(
+            "SELECT timestamp, action, details, status FROM history WHERE session = ? "
+            "ORDER BY rowid DESC LIMIT ? OFFSET ?",
+            (session_id(), HISTORY_PAGE_SIZE, page * HISTORY_PAGE_SIZE)).fetchall()
+
+
+def clear_history():
+    conn = get_db()
+    with get_db_lock(), conn:
+        conn.execute("DELETE FROM history WHERE session = ?", (session_id(),))
 
 
 # =========================
@@ -75,34 +154,86 @@ def schedule_reminder(manager_email: str, subject: str, interval_minutes: int):
     In production: would integrate with email service (SendGrid, etc.)
     Here: simulated
     """
-    from datetime import datetime, timedelta
-
     reminder_time = datetime.now() + timedelta(minutes=interval_minutes)
 
     return {
         'to': manager_email,
         'subject': f"REMINDER: {subject}",
-        'scheduled_time': reminder_time.strftime("%H:%M:%S"),
+        'scheduled_time': reminder_time.time().isoformat(timespec='seconds'),
         'interval': f"{interval_minutes} minutes",
         'status': 'scheduled'
     }
 
 
+def save_reminder(reminder: Dict[str, Any]):
+    conn = get_db()
+    with get_db_lock(), conn:
+        conn.execute(
+            "INSERT INTO reminders VALUES (?, ?, ?, ?, ?, ?)",
+            (reminder['to'], reminder['subject'], reminder['scheduled_time'],
+             reminder['interval'], reminder['status'], session_id()))
+
+
+def reminder_count() -> int:
+    with get_db_lock():
+        return get_db().execute(
+            "SELECT COUNT(*) FROM reminders WHERE session = ?",
+            (session_id(),)).fetchone()[0]
+
+
+def load_reminders(limit: int = HISTORY_PAGE_SIZE) -> List[tuple]:
+    with get_db_lock():
+        return get_db().execute(
+            "SELECT recipient, scheduled_time, subject, interval, status FROM reminders "
+            "WHERE session = ? ORDER BY rowid DESC LIMIT ?",
+            (session_id(), limit)).fetchall()
+
+
 # =========================
 # LLM
 # =========================
 @st.cache_resource
 def get_llm():
-    return ChatOllama(model="qwen2.5:3b", temperature=0)
+    """
+    Ollama by default; set LLM_BASE_URL to use an OpenAI-compatible server
+    instead (e.g. vLLM with a speculative-decoding draft model, see README)
+    """
+    base_url = os.environ.get("LLM_BASE_URL")
+    if base_url:
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
+            base_url=base_url,
+            api_key=os.environ.get("LLM_API_KEY", "EMPTY"),
+            model=os.environ.get("LLM_MODEL", "Qwen/Qwen2.5-3B-Instruct"),
+            temperature=0
+        )  # JSON schema constraint is bound per chain, see _json_llm
+    # 4-bit weights: decode is memory-bandwidth bound, fewer bytes per token
+    return ChatOllama(model="qwen2.5:3b-instruct-q4_K_M", temperature=0, format="json")
 
 
 llm = get_llm()
 
 
+@st.cache_resource
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Single background event loop for async LLM calls
+    The LLM's async HTTP client stays bound to one loop across reruns
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+
+def run_async(coro):
+    """Run a coroutine on the background loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+
 # =========================
 # MODELS
 # =========================
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Email:
     id: int
     sender: str
@@ -112,18 +243,37 @@ class Email:
     priority: str
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class PurchaseRequest:
     item: str
     quantity: int
     budget: float
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Supplier:
     name: str
     price_per_unit: float
     compliant: bool
+    total_cost: float  # price_per_unit * quantity, set once by supplier_agent
+
+
+# =========================
+# Structured output schemas (LLM responses are validated against these)
+class PurchaseRequestModel(BaseModel):
+    item: str
+    quantity: int
+    budget: float
+
+
+class ApprovalEmailModel(BaseModel):
+    subject: str
+    body: str
+    manager_email: str
+
+
+PURCHASE_SCHEMA = PurchaseRequestModel.model_json_schema()
+APPROVAL_SCHEMA = ApprovalEmailModel.model_json_schema()
 
 
 # =========================
@@ -164,11 +314,41 @@ MOCK_EMAILS = [
     ),
 ]
 
+PRIORITY_EMOJI = {"High": "🔴", "Medium": "🟡", "Low": "🟢"}
+STATUS_EMOJI = {"success": "✅", "warning": "⚠️", "error": "❌"}
+
+@st.cache_resource
+def get_procurement_emails() -> List[Email]:
+    """
+    Columnar view of the inbox: filter with one vectorized mask, not a per-email scan
+    Cached per process - module-level code would rebuild it on every rerun
+    """
+    categories = np.array([e.category for e in MOCK_EMAILS])
+    return [MOCK_EMAILS[i] for i in np.flatnonzero(categories == "Procurement Request")]
+
 
 # =========================
 # AGENTS
 # =========================
 
+_JSON_BLOCK = re.compile(r"\{.*\}", re.S)
+
+
+class FastJsonParser(BaseOutputParser[Dict[str, Any]]):
+    """orjson-backed JSON parser - skips any prose around the JSON object"""
+
+    def parse(self, text: str) -> Dict[str, Any]:
+        match = _JSON_BLOCK.search(text)
+        try:
+            return _json_loads(match.group(0) if match else text)
+        except ValueError as e:
+            raise OutputParserException(f"Invalid JSON output: {text}") from e
+
+    @property
+    def _type(self) -> str:
+        return "fast_json"
+
+
 # Email Agent
 email_prompt = ChatPromptTemplate.from_messages([
     ("system",
@@ -178,21 +358,105 @@ email_prompt = ChatPromptTemplate.from_messages([
 ])
 
 
+def _json_llm(schema: Dict[str, Any]):
+    """Grammar-constrain decoding to the schema when served by vLLM"""
+    if os.environ.get("LLM_BASE_URL"):
+        return get_llm().bind(extra_body={"guided_json": schema})
+    return get_llm()  # Ollama: format="json"
+
+
+@st.cache_resource
+def get_email_chain():
+    """Built once per process instead of a new RunnableSequence per call"""
+    return email_prompt | _json_llm(PURCHASE_SCHEMA) | FastJsonParser()
+
+
+EMAIL_CHAIN = get_email_chain()
+
+
+def _to_purchase_request(data: Dict[str, Any]) -> PurchaseRequest:
+    return PurchaseRequest(**PurchaseRequestModel.model_validate(data).model_dump())
+
+
+class _NotCached(Exception):
+    """Raised by a cache probe; st.cache_data never stores exceptions"""
+
+
+@st.cache_data(show_spinner=False)
+def cached_email_extract(email_text: str, _data: Dict[str, Any] | None = None,
+                         _probe: bool = False) -> Dict[str, Any]:
+    """
+    Email bodies are immutable and temperature=0, so extract once per text
+    Underscore arguments are not part of the cache key: _data stores a result
+    fetched elsewhere (the concurrent batch), _probe only looks the text up
+    """
+    if _data is not None:
+        return _data
+    if _probe:
+        raise _NotCached(email_text)
+    return run_async(EMAIL_CHAIN.ainvoke({"email": email_text}))
+
+
+def lookup_email_extract(email_text: str) -> Dict[str, Any] | None:
+    """Cached extraction for this text, or None without calling the LLM"""
+    try:
+        return cached_email_extract(email_text, _probe=True)
+    except _NotCached:
+        return None
+
+
 def email_agent(email_text: str) -> PurchaseRequest:
-    """Legacy email agent - for backward compatibility"""
-    chain = email_prompt | llm | JsonOutputParser()
-    data = chain.invoke({"email": email_text})
-    return PurchaseRequest(
-        item=data["item"],
-        quantity=int(data["quantity"]),
-        budget=float(data["budget"])
+    """Legacy email agent - sync shim for backward compatibility"""
+    return _to_purchase_request(cached_email_extract(email_text))
+
+
+async def _email_agent_gather(email_texts: List[str]) -> list:
+    """Raw extractions, awaited concurrently without blocking each other"""
+    return await asyncio.gather(
+        *(EMAIL_CHAIN.ainvoke({"email": text}) for text in email_texts),
+        return_exceptions=True
     )
 
 
+def email_agent_batch(email_texts: List[str]) -> List[PurchaseRequest | None]:
+    """
+    Extract purchase requests from several emails concurrently
+    Texts already in cached_email_extract skip the LLM; only misses are sent
+    Failed extractions are returned as None (caller falls back to email_agent)
+    """
+    extracted = [lookup_email_extract(text) for text in email_texts]
+    misses = [i for i, data in enumerate(extracted) if data is None]
+    fetched = run_async(_email_agent_gather(
+        [email_texts[i] for i in misses])) if misses else []
+
+    results: List[PurchaseRequest | None] = [None] * len(email_texts)
+    for i, data in zip(misses, fetched):
+        extracted[i] = None if isinstance(data, BaseException) else data
+    fetched_idx = set(misses)
+    for i, data in enumerate(extracted):
+        if data is None:
+            continue
+        try:
+            results[i] = _to_purchase_request(data)
+        except ValueError:
+            continue  # invalid output is not cached
+        if i in fetched_idx:
+            cached_email_extract(email_texts[i], _data=data)
+    return results
+
+
+def get_purchase_request(email_id: int, email_text: str) -> PurchaseRequest:
+    """Use the request pre-extracted at inbox load if available"""
+    cached = st.session_state.extracted_requests.get(email_id)
+    if cached is not None:
+        return cached
+    return email_agent(email_text)
+
+
 def email_agent_wrapper(context, **kwargs):
     """Orchestrator-compatible email agent"""
     email_text = context.email_data.get('body', '')
-    result = email_agent(email_text)
+    result = get_purchase_request(context.email_id, email_text)
     add_history(
         "Email Agent", f"Extracted: {result.item} (qty: {result.quantity})", "success")
     return result
@@ -207,22 +471,27 @@ supplier_prompt = ChatPromptTemplate.from_messages([
 ])
 
 
+@st.cache_data(show_spinner=False)
 def supplier_agent(request: PurchaseRequest) -> List[Supplier]:
     """Returns multiple supplier options"""
     # Simulated - gerçekte database'den gelir
-    import random
-    base_price = request.budget / request.quantity
-
-    suppliers = []
-    for i in range(3):
-        price_variation = random.uniform(0.8, 1.3)
-        suppliers.append(Supplier(
+    # Seeded per request so the same request always gets the same suppliers
+    rng = np.random.default_rng(
+        zlib.crc32(f"{request.item}|{request.quantity}|{request.budget}".encode()))
+    prices = np.round(request.budget / request.quantity * rng.uniform(0.8, 1.3, 3), 2)
+    totals = np.round(prices * request.quantity, 2).tolist()
+    compliant = (rng.random(3) < 0.75).tolist()  # 75% compliant
+    prices = prices.tolist()
+
+    return [
+        Supplier(
             name=f"Supplier_{chr(65+i)}",  # A, B, C
-            price_per_unit=round(base_price * price_variation, 2),
-            compliant=random.choice([True, True, True, False])  # 75% compliant
-        ))
-
-    return suppliers
+            price_per_unit=prices[i],
+            compliant=compliant[i],
+            total_cost=totals[i]
+        )
+        for i in range(3)
+    ]
 
 
 def supplier_agent_wrapper(context, **kwargs):
@@ -235,7 +504,7 @@ def supplier_agent_wrapper(context, **kwargs):
 
 # Compliance Agent
 def compliance_agent(supplier: Supplier, request: PurchaseRequest) -> tuple[bool, str]:
-    total_cost = supplier.price_per_unit * request.quantity
+    total_cost = supplier.total_cost
 
     if not supplier.compliant:
         return False, "Supplier is not compliant with company policies"
@@ -267,17 +536,54 @@ approval_prompt = ChatPromptTemplate.from_messages([
 ])
 
 
-def approval_agent(request: PurchaseRequest, supplier: Supplier, reason: str) -> Dict[str, Any]:
-    total = supplier.price_per_unit * request.quantity
-    chain = approval_prompt | llm | JsonOutputParser()
-    return chain.invoke({
+@st.cache_resource
+def get_approval_stream_chain():
+    """Raw token stream; parsed once generation finishes"""
+    return approval_prompt | _json_llm(APPROVAL_SCHEMA) | StrOutputParser()
+
+
+APPROVAL_STREAM_CHAIN = get_approval_stream_chain()
+
+
+def _approval_inputs(request: PurchaseRequest, supplier: Supplier, reason: str) -> Dict[str, Any]:
+    return {
         "item": request.item,
         "quantity": request.quantity,
         "supplier": supplier.name,
-        "total": total,
+        "total": supplier.total_cost,
         "budget": request.budget,
         "reason": reason
-    })
+    }
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def cached_approval_email(item: str, quantity: int, budget: float, supplier: str,
+                          total_cost: float, reason: str,
+                          _data: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    """
+    Same request/supplier/reason always yields the same email at temperature=0
+    Keyed on primitives; _data (not part of the key) stores a streamed result,
+    calling without it only looks the email up
+    """
+    if _data is None:
+        raise _NotCached(item)
+    return _data
+
+
+def approval_agent_stream(request: PurchaseRequest, supplier: Supplier, reason: str) -> Dict[str, Any]:
+    """Render the email while it is generated, then return the parsed result"""
+    key = (request.item, request.quantity, request.budget,
+           supplier.name, supplier.total_cost, reason)
+    try:
+        return cached_approval_email(*key)
+    except _NotCached:
+        pass
+    st.caption("Generating approval email...")
+    text = st.write_stream(
+        APPROVAL_STREAM_CHAIN.stream(_approval_inputs(request, supplier, reason)))
+    data = FastJsonParser().parse(text)
+    result = ApprovalEmailModel.model_validate(data).model_dump()
+    return cached_approval_email(*key, _data=result)
 
 
 def approval_agent_wrapper(context, **kwargs):
@@ -285,7 +591,8 @@ def approval_agent_wrapper(context, **kwargs):
     request = context.purchase_request
     supplier = context.selected_supplier
     reason = kwargs.get('reason', 'Approval required')
-    result = approval_agent(request, supplier, reason)
+    # Streams into the page that resumed the workflow, so tokens show up immediately
+    result = approval_agent_stream(request, supplier, reason)
     add_history("Approval Agent",
                 f"Email created: {result.get('subject', 'N/A')}", "success")
     return result
@@ -301,7 +608,7 @@ def order_agent_wrapper(context, **kwargs):
         "supplier": supplier.name,
         "item": request.item,
         "quantity": request.quantity,
-        "total_price": supplier.price_per_unit * request.quantity,
+        "total_price": supplier.total_cost,
         "status": "ORDER_PLACED"
     }
 
@@ -331,23 +638,25 @@ def initialize_orchestrator():
     return None
 
 
-def approval_agent(request: PurchaseRequest, supplier: Supplier, reason: str) -> Dict[str, Any]:
-    total = supplier.price_per_unit * request.quantity
-    chain = approval_prompt | llm | JsonOutputParser()
-    return chain.invoke({
-        "item": request.item,
-        "quantity": request.quantity,
-        "supplier": supplier.name,
-        "total": total,
-        "budget": request.budget,
-        "reason": reason
-    })
-
-
 # =========================
 # UI PAGES
 # =========================
 
+# Button callbacks run before the rerun the click triggers, so navigation
+# takes a single script run instead of run -> st.rerun() -> run
+def go_to(page: str):
+    st.session_state.page = page
+
+
+def reset_and_return_to_inbox():
+    st.session_state.selected_email = None
+    st.session_state.purchase_request = None
+    st.session_state.suppliers = None
+    st.session_state.selected_supplier = None
+    st.session_state.approval_email = None
+    st.session_state.page = 'inbox'
+
+
 def page_inbox():
     """IBM Step 1-2: Email Inbox & Classification"""
     st.title("🏢 Greypine Procurement Assistant")
@@ -360,7 +669,14 @@ def page_inbox():
 
     if st.button("📧 Read and classify unread emails in Outlook", type="primary"):
         with st.spinner("Connecting to Outlook and classifying emails..."):
-            time.sleep(1)  # Simulate loading
+            # Pre-extract all procurement requests in one batched LLM call
+            pending = get_procurement_emails()
+            requests = email_agent_batch([e.body for e in pending])
+            st.session_state.extracted_requests = {
+                email.id: request
+                for email, request in zip(pending, requests)
+                if request is not None
+            }
             st.session_state.emails_loaded = True
 
     # Step 2: Show email list if loaded
@@ -370,8 +686,7 @@ def page_inbox():
         # Filter by category
         st.markdown("### 📋 Category: Procurement Requests")
 
-        procurement_emails = [
-            e for e in MOCK_EMAILS if e.category == "Procurement Request"]
+        procurement_emails = get_procurement_emails()
 
         # Display emails as cards
         for email in procurement_emails:
@@ -379,7 +694,7 @@ def page_inbox():
                 col1, col2 = st.columns([4, 1])
 
                 with col1:
-                    priority_emoji = "🔴" if email.priority == "High" else "🟡" if email.priority == "Medium" else "🟢"
+                    priority_emoji = PRIORITY_EMOJI.get(email.priority, "⚪")
                     st.markdown(f"**{priority_emoji} From:** {email.sender}")
                     st.markdown(f"**Subject:** {email.subject}")
 
@@ -429,9 +744,7 @@ def page_detail():
 
     email = st.session_state.selected_email
 
-    if st.button("← Back to Inbox"):
-        st.session_state.page = 'inbox'
-        st.rerun()
+    st.button("← Back to Inbox", on_click=go_to, args=('inbox',))
 
     st.divider()
 
@@ -456,14 +769,14 @@ def page_detail():
         if "purchase" in user_input.lower() or "initiate" in user_input.lower():
             with st.spinner("🔄 Extracting purchase request and contacting Sourcing Agent..."):
                 # Email Agent extracts request
-                st.session_state.purchase_request = email_agent(email.body)
+                st.session_state.purchase_request = get_purchase_request(
+                    email.id, email.body)
                 add_history(
                     "Purchase Request Created",
                     f"Item: {st.session_state.purchase_request.item}, Qty: {st.session_state.purchase_request.quantity}"
                 )
-                time.sleep(1)
 
-            st.success("✅ Purchase request created!")
+            st.toast("✅ Purchase request created!")
             st.session_state.page = 'sourcing'
             st.rerun()
         else:
@@ -484,9 +797,7 @@ def page_sourcing():
         request = st.session_state.purchase_request
         suppliers = st.session_state.suppliers
 
-    if st.button("← Back"):
-        st.session_state.page = 'detail'
-        st.rerun()
+    st.button("← Back", on_click=go_to, args=('detail',))
 
     st.divider()
 
@@ -503,51 +814,56 @@ def page_sourcing():
     st.markdown("### 🏢 Available Suppliers")
     st.info("✨ Suppliers found by Orchestrator's Sourcing Agent")
 
-    # Display as table
-    for idx, supplier in enumerate(suppliers):
-        total_cost = supplier.price_per_unit * request.quantity
-        compliance_badge = "✅ Compliant" if supplier.compliant else "❌ Non-compliant"
-
-        with st.container():
-            col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 2, 1])
-
-            col1.markdown(f"**{supplier.name}**")
-            col2.markdown(f"Unit: {supplier.price_per_unit} TL")
-            col3.markdown(f"Total: {total_cost} TL")
-            col4.markdown(compliance_badge)
-
-            if col5.button("Select", key=f"supplier_{idx}"):
-                # 🆕 ORCHESTRATOR MODE
-                if ORCHESTRATOR_AVAILABLE and st.session_state.orchestrator and st.session_state.workflow_context:
-                    orchestrator = st.session_state.orchestrator
-                    context = st.session_state.workflow_context
-
-                    with st.spinner("🤖 Orchestrator resuming workflow..."):
-                        # Resume workflow with supplier selection
-                        user_input = {'selected_supplier': supplier}
-                        context = orchestrator.resume_workflow(
-                            context, user_input)
-                        st.session_state.workflow_context = context
-
-                    # Navigate based on workflow status
-                    if context.workflow_status == WorkflowStatus.REQUIRES_APPROVAL:
-                        st.session_state.page = 'approval'
-                    elif context.workflow_status == WorkflowStatus.SUCCESS:
-                        st.session_state.page = 'order'
-                    elif context.workflow_status == WorkflowStatus.FAILED:
-                        st.error("❌ Workflow failed")
-                        st.session_state.page = 'inbox'
-
-                    st.rerun()
-                else:
-                    # Legacy mode
-                    st.session_state.selected_supplier = supplier
-                    add_history(
-                        "Supplier Selected", f"{supplier.name} - {supplier.price_per_unit} TL/unit")
-                    st.session_state.page = 'compliance'
-                    st.rerun()
+    # Display as table - one widget for all rows instead of 5 per supplier
+    table = st.dataframe(
+        {
+            "Supplier": [s.name for s in suppliers],
+            "Unit (TL)": [s.price_per_unit for s in suppliers],
+            "Total (TL)": [s.total_cost for s in suppliers],
+            "Compliance": ["✅ Compliant" if s.compliant else "❌ Non-compliant" for s in suppliers],
+        },
+        hide_index=True,
+        on_select="rerun",
+        selection_mode="single-row",
+        key="supplier_table"
+    )
 
-            st.divider()
+    rows = table.selection.rows
+    if not rows:
+        st.caption("Select a supplier row to continue")
+        return
+
+    supplier = suppliers[rows[0]]
+    if st.button(f"Select {supplier.name}", type="primary"):
+        # 🆕 ORCHESTRATOR MODE
+        if ORCHESTRATOR_AVAILABLE and st.session_state.orchestrator and st.session_state.workflow_context:
+            orchestrator = st.session_state.orchestrator
+            context = st.session_state.workflow_context
+
+            with st.spinner("🤖 Orchestrator resuming workflow..."):
+                # Resume workflow with supplier selection
+                user_input = {'selected_supplier': supplier}
+                context = orchestrator.resume_workflow(
+                    context, user_input)
+                st.session_state.workflow_context = context
+
+            # Navigate based on workflow status
+            if context.workflow_status == WorkflowStatus.REQUIRES_APPROVAL:
+                st.session_state.page = 'approval'
+            elif context.workflow_status == WorkflowStatus.SUCCESS:
+                st.session_state.page = 'order'
+            elif context.workflow_status == WorkflowStatus.FAILED:
+                st.error("❌ Workflow failed")
+                st.session_state.page = 'inbox'
+
+            st.rerun()
+        else:
+            # Legacy mode
+            st.session_state.selected_supplier = supplier
+            add_history(
+                "Supplier Selected", f"{supplier.name} - {supplier.price_per_unit} TL/unit")
+            st.session_state.page = 'compliance'
+            st.rerun()
 
 
 def page_compliance():
@@ -557,18 +873,11 @@ def page_compliance():
     supplier = st.session_state.selected_supplier
     request = st.session_state.purchase_request
 
-    if st.button("← Back to Supplier Selection"):
-        st.session_state.page = 'sourcing'
-        st.rerun()
+    st.button("← Back to Supplier Selection", on_click=go_to, args=('sourcing',))
 
     st.divider()
 
-    st.markdown("### 🔍 Running Compliance Check...")
-
-    progress_bar = st.progress(0)
-    for i in range(100):
-        time.sleep(0.01)
-        progress_bar.progress(i + 1)
+    st.markdown("### 🔍 Compliance Check")
 
     # Run compliance
     is_compliant, reason = compliance_agent(supplier, request)
@@ -576,11 +885,10 @@ def page_compliance():
     st.divider()
 
     if is_compliant:
-        st.success("✅ Compliance check passed!")
+        st.toast("✅ Compliance check passed!")
         add_history("Compliance Check",
                     "Passed - All requirements met", "success")
         st.session_state.page = 'order'
-        time.sleep(1)
         st.rerun()
     else:
         st.error(f"❌ Compliance Issue: {reason}")
@@ -588,12 +896,10 @@ def page_compliance():
         add_history("Compliance Check", f"Failed - {reason}", "warning")
 
         if st.button("📧 Send Approval Request", type="primary"):
-            with st.spinner("Generating approval email..."):
-                st.session_state.approval_email = approval_agent(
-                    request, supplier, reason)
-                add_history(
-                    "Approval Request", f"Email sent to {st.session_state.approval_email.get('manager_email', 'manager')}")
-                time.sleep(1)
+            st.session_state.approval_email = approval_agent_stream(
+                request, supplier, reason)
+            add_history(
+                "Approval Request", f"Email sent to {st.session_state.approval_email.get('manager_email', 'manager')}")
             st.session_state.page = 'approval'
             st.rerun()
 
@@ -609,9 +915,7 @@ def page_approval():
     else:
         approval = st.session_state.approval_email
 
-    if st.button("← Back"):
-        st.session_state.page = 'compliance'
-        st.rerun()
+    st.button("← Back", on_click=go_to, args=('compliance',))
 
     st.divider()
 
@@ -652,8 +956,7 @@ def page_approval():
         else:
             st.session_state.approval_email = updated_email
 
-        st.success("✅ Email updated!")
-        time.sleep(1)
+        st.toast("✅ Email updated!")
         st.rerun()
 
     st.divider()
@@ -711,7 +1014,7 @@ def page_approval():
         if st.button("📅 Schedule Email Reminder", key="schedule_reminder_btn"):
             reminder = schedule_reminder(
                 manager_email, subject, reminder_interval)
-            st.session_state.scheduled_reminders.append(reminder)
+            save_reminder(reminder)
 
             add_history(
                 "Reminder Scheduled",
@@ -743,26 +1046,23 @@ def page_approval():
                     context = orchestrator.resume_workflow(context, user_input)
                     st.session_state.workflow_context = context
 
-                st.success("✅ Manager approved the request!")
+                st.toast("✅ Manager approved the request!")
                 add_history("Manager Approval", "Request approved", "success")
                 st.session_state.approval_sent = False
-                time.sleep(1)
                 st.session_state.page = 'order'
                 st.rerun()
             else:
                 # Legacy mode
-                st.success("✅ Manager approved the request!")
+                st.toast("✅ Manager approved the request!")
                 add_history("Manager Approval", "Request approved", "success")
                 st.session_state.approval_sent = False
-                time.sleep(1)
                 st.session_state.page = 'order'
                 st.rerun()
 
         if col_reject.button("❌ Manager Rejects", type="secondary", key="manager_reject"):
-            st.error("❌ Manager rejected the request")
+            st.toast("❌ Manager rejected the request")
             add_history("Manager Approval", "Request rejected", "error")
             st.session_state.approval_sent = False
-            time.sleep(1)
             st.session_state.page = 'inbox'
             st.rerun()
 
@@ -791,13 +1091,13 @@ def page_order():
             st.markdown("**Execution Log:**")
             for log in context.execution_log:
                 st.text(
-                    f"{log['timestamp']} - {log['agent']}: {log['status']}")
+                    f"{log.timestamp} - {log.agent}: {log.status}")
     else:
         # Legacy mode
         request = st.session_state.purchase_request
         supplier = st.session_state.selected_supplier
 
-    total = supplier.price_per_unit * request.quantity
+    total = supplier.total_cost
 
     # Add to history
     if not st.session_state.workflow_context:
@@ -827,102 +1127,85 @@ def page_order():
 
     st.divider()
 
-    if st.button("🔙 Return to Inbox", type="primary"):
-        # Reset state
-        st.session_state.selected_email = None
-        st.session_state.purchase_request = None
-        st.session_state.suppliers = None
-        st.session_state.selected_supplier = None
-        st.session_state.approval_email = None
-        st.session_state.page = 'inbox'
-        st.rerun()
+    st.button("🔙 Return to Inbox", type="primary", on_click=reset_and_return_to_inbox)
 
 
 def page_history():
     """History/Timeline Page - Shows all actions"""
     st.title("📜 Process History & Timeline")
 
-    if st.button("← Back"):
-        st.session_state.page = 'inbox'
-        st.rerun()
+    st.button("← Back", on_click=go_to, args=('inbox',))
 
     st.divider()
 
     # 🆕 SCHEDULED REMINDERS SECTION
-    reminders = st.session_state.get('scheduled_reminders', [])
+    reminders = load_reminders()
     if reminders:
         st.markdown("### ⏰ Scheduled Reminders")
-
-        for reminder in reminders:
-            with st.container():
-                col1, col2, col3 = st.columns([2, 3, 3])
-
-                with col1:
-                    st.markdown(f"📧 **{reminder['to']}**")
-
-                with col2:
-                    st.markdown(f"🕐 {reminder['scheduled_time']}")
-
-                with col3:
-                    st.markdown(f"📝 {reminder['subject'][:40]}...")
-
-                st.caption(
-                    f"Interval: {reminder['interval']} | Status: ⏳ {reminder['status']}")
-                st.divider()
+        st.dataframe(
+            {
+                "To": [r[0] for r in reminders],
+                "Time": [r[1] for r in reminders],
+                "Subject": [r[2] for r in reminders],
+                "Interval": [r[3] for r in reminders],
+                "Status": [f"⏳ {r[4]}" for r in reminders],
+            },
+            hide_index=True
+        )
 
         st.divider()
 
-    history = st.session_state.history
+    total = history_count()
 
-    if not history:
+    if not total:
         st.info(
             "🔍 No actions recorded yet. Start a procurement process to see the timeline.")
         return
 
-    st.markdown(f"### 📊 Total Actions: {len(history)}")
+    st.markdown(f"### 📊 Total Actions: {total}")
     st.divider()
 
-    # Display history in reverse (newest first)
-    for idx, event in enumerate(reversed(history)):
-        # Status emoji
-        if event['status'] == 'success':
-            status_emoji = "✅"
-            status_color = "green"
-        elif event['status'] == 'warning':
-            status_emoji = "⚠️"
-            status_color = "orange"
-        elif event['status'] == 'error':
-            status_emoji = "❌"
-            status_color = "red"
-        else:
-            status_emoji = "🔵"
-            status_color = "blue"
-
-        with st.container():
-            col1, col2, col3 = st.columns([1, 3, 6])
-
-            with col1:
-                st.markdown(f"**{event['timestamp']}**")
-
-            with col2:
-                st.markdown(f"{status_emoji} **{event['action']}**")
-
-            with col3:
-                st.markdown(f"_{event['details']}_")
-
-            st.divider()
+    last_page = (total - 1) // HISTORY_PAGE_SIZE
+    page = min(st.session_state.history_page, last_page)
+    if last_page > 0:
+        page = st.number_input(
+            f"Page (1-{last_page + 1})", min_value=1, max_value=last_page + 1,
+            value=page + 1) - 1
+        st.session_state.history_page = page
+
+    # Newest first
+    events = load_history_page(page)
+    st.dataframe(
+        {
+            "Time": [e[0] for e in events],
+            "Action": [f"{STATUS_EMOJI.get(e[3], '🔵')} {e[1]}" for e in events],
+            "Details": [e[2] for e in events],
+        },
+        hide_index=True,
+        use_container_width=True
+    )
 
     # Clear history button
     if st.button("🗑️ Clear History", type="secondary"):
-        st.session_state.history = []
-        st.success("History cleared!")
-        time.sleep(1)
+        clear_history()
+        st.session_state.history_page = 0
+        st.toast("History cleared!")
         st.rerun()
 
 
 # =========================
 # MAIN ROUTER
 # =========================
+PAGES = {
+    'inbox': page_inbox,
+    'detail': page_detail,
+    'sourcing': page_sourcing,
+    'compliance': page_compliance,
+    'approval': page_approval,
+    'order': page_order,
+    'history': page_history,
+}
+
 
 def main():
     # Sidebar navigation (optional)
@@ -934,9 +1217,7 @@ def main():
         st.divider()
 
         # History button
-        if st.button("📜 View History", use_container_width=True):
-            st.session_state.page = 'history'
-            st.rerun()
+        st.button("📜 View History", use_container_width=True, on_click=go_to, args=('history',))
 
         st.divider()
 
@@ -955,14 +1236,14 @@ def main():
         st.info(f"**Current Step:**\n{current_step}")
 
         # Show history count
-        history_count = len(st.session_state.get('history', []))
-        reminder_count = len(st.session_state.get('scheduled_reminders', []))
+        actions = history_count()
+        reminders = reminder_count()
 
         col1, col2 = st.columns(2)
-        if history_count > 0:
-            col1.metric("Actions", history_count)
-        if reminder_count > 0:
-            col2.metric("⏰ Reminders", reminder_count)
+        if actions > 0:
+            col1.metric("Actions", actions)
+        if reminders > 0:
+            col2.metric("⏰ Reminders", reminders)
 
         # 🆕 Orchestrator Status
         if ORCHESTRATOR_AVAILABLE and st.session_state.workflow_context:
@@ -988,23 +1269,10 @@ def main():
             if agents_executed > 0:
                 st.metric("Agents Executed", agents_executed)
 
-    # Route to correct page
-    page = st.session_state.page
-
-    if page == 'inbox':
-        page_inbox()
-    elif page == 'detail':
-        page_detail()
-    elif page == 'sourcing':
-        page_sourcing()
-    elif page == 'compliance':
-        page_compliance()
-    elif page == 'approval':
-        page_approval()
-    elif page == 'order':
-        page_order()
-    elif page == 'history':
-        page_history()
+    # Route to correct page - only the active page's render code runs
+    render_page = PAGES.get(st.session_state.page)
+    if render_page:
+        render_page()
 
 
 if __name__ == "__main__":
@@ -1,5 +1,13 @@
 import streamlit as st
-from dataclasses import dataclass
+import asyncio
+import uuid
+from collections import deque
+from pathlib import Path
+import os
+import pickle
+import re
+import stat
+import threading
 from typing import List, Dict, Any
 import time
 from datetime import datetime, timedelta
@@ -7,6 +15,16 @@ from datetime import datetime, timedelta
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_ollama import ChatOllama
 from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.exceptions import OutputParserException
+import numpy as np
+import orjson
+
+from models import PROCUREMENT_EMAILS, PurchaseRequest, Supplier, SupplierPool
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # =========================
 # ORCHESTRATOR IMPORT
@@ -16,7 +34,8 @@ try:
         ProcurementOrchestrator,
         WorkflowContext,
         WorkflowStatus,
-        AgentStatus
+        AgentStatus,
+        coalesce_stream
     )
     ORCHESTRATOR_AVAILABLE = True
 except ImportError:
@@ -27,83 +46,77 @@ except ImportError:
 # =========================
 # LLM
 # =========================
+# Q4_K_M for speed; use "qwen2.5:3b-instruct-q8_0" for accuracy-sensitive deployments
+LLM_MODEL = "qwen2.5:3b-instruct-q4_K_M"
+# JSON outputs are short; the cap bounds decode time
+# (room for request + approval template from the combined prompt)
+LLM_NUM_PREDICT = 384
+# Same context size on every request (warm-up included): a different num_ctx
+# makes Ollama reload the model and drop the cached KV prefix of the system prompts
+LLM_NUM_CTX = 2048
+
+
 @st.cache_resource
 def get_llm():
-    return ChatOllama(model="qwen2.5:3b", temperature=0)
+    return ChatOllama(model=LLM_MODEL, temperature=0, num_ctx=LLM_NUM_CTX,
+                      num_predict=LLM_NUM_PREDICT, keep_alive="1h")
+
+
+@st.cache_resource
+def get_allm():
+    """Async-invoked LLM - its HTTP client lives on the background loop below"""
+    return ChatOllama(model=LLM_MODEL, temperature=0, num_ctx=LLM_NUM_CTX,
+                      num_predict=LLM_NUM_PREDICT, keep_alive="1h")
 
 
 llm = get_llm()
+allm = get_allm()
 
 
-# =========================
-# MODELS
-# =========================
-@dataclass
-class Email:
-    id: int
-    sender: str
-    subject: str
-    body: str
-    category: str
-    priority: str
+@st.cache_resource
+def warm_up_llm() -> bool:
+    """
+    Load the model into memory once per process, before the first email click
+    Disable with LLM_WARMUP=0 to keep dev reloads fast
+    """
+    if os.environ.get("LLM_WARMUP", "1") == "0":
+        return False
+    try:
+        # 1-token generation; keep_alive pins the model between reruns
+        ChatOllama(model=LLM_MODEL, num_ctx=LLM_NUM_CTX,
+                   num_predict=1, keep_alive="1h").invoke("ping")
+    except Exception as e:
+        print(f"⚠️ LLM warm-up failed: {e}")
+        return False
+    return True
 
 
-@dataclass
-class PurchaseRequest:
-    item: str
-    quantity: int
-    budget: float
+@st.cache_resource
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """One long-lived loop for all async LLM calls (shared across reruns)"""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
 
 
-@dataclass
-class Supplier:
-    name: str
-    price_per_unit: float
-    compliant: bool
+def run_async(coro):
+    """Run a coroutine on the background loop and block until it finishes"""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
 
 
 # =========================
 # MOCK DATA
 # =========================
-MOCK_EMAILS = [
-    Email(
-        id=1,
-        sender="Cassie Matthews",
-        subject="Urgent: Branded Water Bottles Needed",
-        body="Hi, we need 300 branded water bottles for the upcoming conference. Budget is 15000 TL. Please process ASAP.",
-        category="Procurement Request",
-        priority="High"
-    ),
-    Email(
-        id=2,
-        sender="John Smith",
-        subject="Office Supplies Request",
-        body="Please order 50 notebooks and 100 pens. Budget: 2000 TL.",
-        category="Procurement Request",
-        priority="Medium"
-    ),
-    Email(
-        id=3,
-        sender="Sarah Connor",
-        subject="Meeting Room Update",
-        body="The meeting room schedule has been updated.",
-        category="General",
-        priority="Low"
-    ),
-    Email(
-        id=4,
-        sender="Mike Johnson",
-        subject="Laptop Purchase Request",
-        body="Need 10 laptops for new employees. Budget is 80000 TL.",
-        category="Procurement Request",
-        priority="High"
-    ),
-]
+# MOCK_EMAILS / PROCUREMENT_EMAILS live in models.py: an imported module runs
+# once per process, this script runs again on every rerun
+_PRIO_EMOJI = {"High": "🔴", "Medium": "🟡", "Low": "🟢"}
 
 
 # =========================
 # PROMPTS
 # =========================
+# Static system text first, variable input last, so consecutive calls share a
+# token prefix the server can reuse from its KV cache
 email_prompt = ChatPromptTemplate.from_messages([
     ("system",
      "Extract purchase request from email. Return JSON with: item, quantity, budget.\n"
@@ -119,13 +132,75 @@ approval_prompt = ChatPromptTemplate.from_messages([
 ])
 
 
+# One request instead of two: extraction plus an approval email template whose
+# supplier/total/reason placeholders are filled in locally if approval is needed
+combined_prompt = ChatPromptTemplate.from_messages([
+    ("system",
+     "Extract the purchase request from the email and draft the approval email "
+     "to the requester's manager in case the order exceeds budget.\n"
+     "Return JSON with keys:\n"
+     "purchase_request: {{\"item\": str, \"quantity\": int, \"budget\": float}}\n"
+     "approval_template: {{\"subject\": str, \"body\": str, \"manager_email\": str}}\n"
+     "In the template write the placeholders {{supplier}}, {{total}} and {{reason}} "
+     "literally where the supplier name, total cost (TL) and approval reason go."),
+    ("human", "{email}")
+])
+
+APPROVAL_TEMPLATE_KEYS = ("subject", "body", "manager_email")
+
+# Bulk mode: every email in one prompt, one JSON array back
+batch_email_prompt = ChatPromptTemplate.from_messages([
+    ("system",
+     "Extract the purchase request from each email. Return a JSON array where "
+     "element i corresponds to [[EMAIL i]], each element: "
+     "{{\"item\": str, \"quantity\": int, \"budget\": float}}."),
+    ("human", "{emails}")
+])
+
+
+@st.cache_resource
+def get_email_chain():
+    return email_prompt | allm
+
+
+@st.cache_resource
+def get_approval_chain():
+    return approval_prompt | allm
+
+
+@st.cache_resource
+def get_combined_chain():
+    return combined_prompt | allm
+
+
+@st.cache_resource
+def get_batch_email_chain():
+    return batch_email_prompt | allm | JsonOutputParser()
+
+
 # =========================
 # HELPER FUNCTIONS
 # =========================
+_JSON_RE = re.compile(r"\{.*\}", re.S)
+_json_fallback = JsonOutputParser()
+
+
+def fast_parse(text: str) -> Dict:
+    """First {...} block via orjson; LangChain's lenient parser only if that fails"""
+    match = _JSON_RE.search(text)
+    try:
+        return orjson.loads(match.group(0))
+    except (AttributeError, orjson.JSONDecodeError):
+        return _json_fallback.parse(text)
+
+
+HISTORY_MAXLEN = 500  # oldest events drop off in long sessions
+
+
 def add_history(action: str, details: str, status: str = "success"):
-    """Add event to history with timestamp"""
-    st.session_state.history.append({
-        'timestamp': datetime.now().strftime("%H:%M:%S"),
+    """Add event to history with timestamp (newest first)"""
+    st.session_state.history.appendleft({
+        'ts': time.time(),  # formatted only when the history page renders
         'action': action,
         'details': details,
         'status': status
@@ -147,9 +222,9 @@ def schedule_reminder(manager_email: str, subject: str, interval_minutes: int):
 # =========================
 # AGENT FUNCTIONS (Core Logic)
 # =========================
-def run_email_agent(email_body: str) -> PurchaseRequest:
-    chain = email_prompt | llm | JsonOutputParser()
-    data = chain.invoke({"email": email_body})
+async def arun_email_agent(email_body: str) -> PurchaseRequest:
+    raw = await get_email_chain().ainvoke({"email": email_body})
+    data = fast_parse(raw.content)
     return PurchaseRequest(
         item=data["item"],
         quantity=int(data["quantity"]),
@@ -157,18 +232,107 @@ def run_email_agent(email_body: str) -> PurchaseRequest:
     )
 
 
-def run_supplier_agent(request: PurchaseRequest) -> List[Supplier]:
-    import random
+@st.cache_data(max_entries=256, show_spinner=False)
+def _run_email_agent_cached(email_body: str) -> PurchaseRequest:
+    """Exact-match cache: same email body -> same request, across reruns"""
+    return run_async(arun_email_agent(email_body))
+
+
+def run_email_agent(email_body: str) -> PurchaseRequest:
+    return _run_email_agent_cached(email_body)
+
+
+async def arun_combined_agent(email_body: str) -> tuple:
+    """Returns (PurchaseRequest, approval template) from a single LLM call"""
+    raw = await get_combined_chain().ainvoke({"email": email_body})
+    data = fast_parse(raw.content)
+    request = data["purchase_request"]
+    template = data["approval_template"]
+    return (
+        PurchaseRequest(
+            item=request["item"],
+            quantity=int(request["quantity"]),
+            budget=float(request["budget"])
+        ),
+        {key: str(template[key]) for key in APPROVAL_TEMPLATE_KEYS}
+    )
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _run_combined_agent_cached(email_body: str) -> tuple:
+    return run_async(arun_combined_agent(email_body))
+
+
+def run_combined_agent(email_body: str) -> tuple:
+    # st.cache_data returns a fresh copy, the template dict is safe to keep
+    return _run_combined_agent_cached(email_body)
+
+
+def fill_approval_template(template: Dict, request: PurchaseRequest,
+                           supplier: Supplier, reason: str) -> Dict:
+    values = {
+        "{supplier}": supplier.name,
+        "{total}": str(supplier.price_per_unit * request.quantity),
+        "{reason}": reason,
+    }
+    filled = {}
+    for key, text in template.items():
+        for placeholder, value in values.items():
+            text = text.replace(placeholder, value)
+        filled[key] = text
+    return filled
+
+
+def run_email_agent_batch(email_bodies: List[str]) -> List[PurchaseRequest]:
+    """One HTTP round trip + one prefill for all emails instead of one per email"""
+    emails = "\n\n".join(
+        f"[[EMAIL {i}]]\n{body}" for i, body in enumerate(email_bodies, 1))
+    data = run_async(get_batch_email_chain().ainvoke({"emails": emails}))
+    if isinstance(data, dict) and len(data) == 1:
+        # Model wrapped the array in an object, e.g. {"requests": [...]}
+        data = next(iter(data.values()))
+    if not isinstance(data, list) or len(data) != len(email_bodies):
+        raise ValueError(
+            f"Expected {len(email_bodies)} purchase requests, got: {data!r}")
+    return [
+        PurchaseRequest(
+            item=d["item"],
+            quantity=int(d["quantity"]),
+            budget=float(d["budget"])
+        )
+        for d in data
+    ]
+
+
+async def _gather_combined_agents(email_bodies: List[str]) -> list:
+    return await asyncio.gather(
+        *(arun_combined_agent(body) for body in email_bodies),
+        return_exceptions=True
+    )
+
+
+def run_email_agents_concurrently(email_bodies: List[str]) -> List[tuple | None]:
+    """
+    Overlap several extractions (needs OLLAMA_NUM_PARALLEL > 1 on the server)
+    Each result is (PurchaseRequest, approval template), or None on failure -
+    the workflow re-runs those on selection
+    """
+    results = run_async(_gather_combined_agents(email_bodies))
+    return [None if isinstance(r, BaseException) else r for r in results]
+
+
+def _supplier_name(i: int) -> str:
+    return f"Supplier_{chr(65+i)}" if i < 26 else f"Supplier_{i + 1}"
+
+
+def run_supplier_agent(request: PurchaseRequest, n: int = 3) -> SupplierPool:
+    rng = np.random.default_rng()
     base_price = request.budget / request.quantity
-    suppliers = []
-    for i in range(3):
-        price_variation = random.uniform(0.8, 1.3)
-        suppliers.append(Supplier(
-            name=f"Supplier_{chr(65+i)}",
-            price_per_unit=round(base_price * price_variation, 2),
-            compliant=random.choice([True, True, True, False])
-        ))
-    return suppliers
+    return SupplierPool(
+        names=np.array([_supplier_name(i) for i in range(n)]),
+        prices=np.round(base_price * rng.uniform(0.8, 1.3, n), 2),
+        compliant=rng.random(n) > 0.25  # 75% compliant
+    )
 
 
 def run_compliance_agent(supplier: Supplier, request: PurchaseRequest) -> tuple:
@@ -180,17 +344,46 @@ def run_compliance_agent(supplier: Supplier, request: PurchaseRequest) -> tuple:
     return True, ""
 
 
-def run_approval_agent(request: PurchaseRequest, supplier: Supplier, reason: str) -> Dict:
-    total = supplier.price_per_unit * request.quantity
-    chain = approval_prompt | llm | JsonOutputParser()
-    return chain.invoke({
+def _approval_inputs(request: PurchaseRequest, supplier: Supplier, reason: str) -> Dict:
+    return {
         "item": request.item,
         "quantity": request.quantity,
         "supplier": supplier.name,
-        "total": total,
+        "total": supplier.price_per_unit * request.quantity,
         "budget": request.budget,
         "reason": reason
-    })
+    }
+
+
+async def arun_approval_agent(request: PurchaseRequest, supplier: Supplier, reason: str) -> Dict:
+    raw = await get_approval_chain().ainvoke(
+        _approval_inputs(request, supplier, reason))
+    return fast_parse(raw.content)
+
+
+def stream_approval(request: PurchaseRequest, supplier: Supplier, reason: str):
+    """Yield the approval email JSON as it is generated (for st.write_stream)"""
+    tokens = (chunk.content for chunk in (approval_prompt | llm).stream(
+        _approval_inputs(request, supplier, reason)))
+    # ~200 ms pieces: a few redraws per second instead of one per token
+    yield from coalesce_stream(tokens)
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _run_approval_agent_cached(item: str, quantity: int, budget: float,
+                               supplier_name: str, price_per_unit: float,
+                               reason: str) -> Dict:
+    return run_async(arun_approval_agent(
+        PurchaseRequest(item, quantity, budget),
+        Supplier(supplier_name, price_per_unit, True),
+        reason))
+
+
+def run_approval_agent(request: PurchaseRequest, supplier: Supplier, reason: str) -> Dict:
+    # st.cache_data hands out a fresh copy, callers can't mutate the cached entry
+    return _run_approval_agent_cached(
+        request.item, request.quantity, request.budget,
+        supplier.name, supplier.price_per_unit, reason)
 
 
 def run_order_agent(request: PurchaseRequest, supplier: Supplier) -> Dict:
@@ -207,7 +400,15 @@ def run_order_agent(request: PurchaseRequest, supplier: Supplier) -> Dict:
 # ORCHESTRATOR AGENT WRAPPERS
 # =========================
 def email_agent_wrapper(context, **kwargs):
-    result = run_email_agent(context.email_data.get('body', ''))
+    result = st.session_state.extracted_requests.get(context.email_id)
+    if result is None:
+        email_body = context.email_data.get('body', '')
+        try:
+            result, template = run_combined_agent(email_body)
+            st.session_state.approval_templates[context.email_id] = template
+        except Exception:
+            # Split path: extraction only, approval email generated later if needed
+            result = run_email_agent(email_body)
     add_history("📨 Email Agent",
                 f"Extracted: {result.item} (qty: {result.quantity}, budget: {result.budget} TL)", "success")
     return result
@@ -231,11 +432,18 @@ def compliance_agent_wrapper(context, **kwargs):
 
 
 def approval_agent_wrapper(context, **kwargs):
-    result = run_approval_agent(
-        context.purchase_request,
-        context.selected_supplier,
-        kwargs.get('reason', 'Approval required')
-    )
+    reason = kwargs.get('reason', 'Approval required')
+    template = st.session_state.approval_templates.get(context.email_id)
+    if template:
+        # Drafted together with the extraction - no second LLM round trip
+        result = fill_approval_template(
+            template, context.purchase_request, context.selected_supplier, reason)
+    else:
+        result = run_approval_agent(
+            context.purchase_request,
+            context.selected_supplier,
+            reason
+        )
     add_history("📧 Approval Agent",
                 f"Email created: {result.get('subject', 'N/A')}", "success")
     return result
@@ -274,16 +482,26 @@ def init_session_state():
     defaults = {
         'page': 'inbox',
         'selected_email': None,
-        'history': [],
+        'history': deque(maxlen=HISTORY_MAXLEN),
         'scheduled_reminders': [],
         'workflow_context': None,
         'approval_sent': False,
         'emails_loaded': False,
+        'extracted_requests': {},
+        'approval_templates': {},
     }
     for key, value in defaults.items():
         if key not in st.session_state:
             st.session_state[key] = value
 
+    # Fresh session (e.g. browser refresh) - pick up an in-flight workflow
+    if 'context_restored' not in st.session_state:
+        st.session_state.context_restored = True
+        ctx = _load_ctx()
+        if ctx is not None:
+            st.session_state.workflow_context = ctx
+            st.session_state.page = _PAGE_FOR_STATUS.get(ctx.workflow_status, 'inbox')
+
     # Orchestrator - sadece bir kez başlat
     if 'orchestrator' not in st.session_state:
         st.session_state.orchestrator = initialize_orchestrator()
@@ -291,6 +509,83 @@ def init_session_state():
             add_history(
                 "🤖 System", "Orchestrator initialized - 5 agents registered", "success")
 
+    if 'llm_warm' not in st.session_state:
+        with st.spinner("Loading model..."):
+            st.session_state.llm_warm = warm_up_llm()
+
+
+# =========================
+# CONTEXT PERSISTENCE
+# =========================
+# In-flight workflows survive a browser refresh: the context is written after
+# every orchestrator step and reloaded for the same ?sid= in the URL.
+# Contexts are unpickled on load, so the directory must be private to the app.
+CONTEXT_DIR = Path(os.environ.get("PROCUREMENT_CONTEXT_DIR", ".procurement_context"))
+_CONTEXT_SUFFIX = ".pkl.zst" if zstandard else ".pkl"
+_SID_RE = re.compile(r"[0-9a-f]{32}")
+
+
+def _session_id() -> str:
+    sid = st.query_params.get("sid")
+    if not sid or not _SID_RE.fullmatch(sid):
+        sid = uuid.uuid4().hex
+        st.query_params["sid"] = sid
+    return sid
+
+
+def _context_dir() -> Path:
+    CONTEXT_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+    info = CONTEXT_DIR.stat()
+    if os.name == "posix" and (info.st_uid != os.getuid()
+                               or stat.S_IMODE(info.st_mode) & 0o077):
+        raise PermissionError(
+            f"{CONTEXT_DIR} must be owned by this user with mode 0700")
+    return CONTEXT_DIR
+
+
+def _context_path() -> Path:
+    return _context_dir() / f"{_session_id()}{_CONTEXT_SUFFIX}"
+
+
+def _persist_ctx(ctx):
+    path = _context_path()
+    if ctx is None:
+        path.unlink(missing_ok=True)
+        return
+    data = pickle.dumps(ctx, protocol=pickle.HIGHEST_PROTOCOL)
+    if zstandard:
+        data = zstandard.ZstdCompressor(level=3).compress(data)
+    path.write_bytes(data)
+
+
+def _load_ctx():
+    try:
+        path = _context_path()
+        if not path.exists():
+            return None
+        data = path.read_bytes()
+        if zstandard:
+            data = zstandard.ZstdDecompressor().decompress(data)
+        return pickle.loads(data)
+    except Exception as e:
+        print(f"⚠️ Could not restore workflow context: {e}")
+        return None
+
+
+def set_workflow_context(ctx):
+    st.session_state.workflow_context = ctx
+    try:
+        _persist_ctx(ctx)
+    except (OSError, pickle.PickleError) as e:
+        print(f"⚠️ Could not persist workflow context: {e}")
+
+
+_PAGE_FOR_STATUS = {
+    WorkflowStatus.PENDING: 'sourcing',
+    WorkflowStatus.REQUIRES_APPROVAL: 'approval',
+    WorkflowStatus.SUCCESS: 'order',
+} if ORCHESTRATOR_AVAILABLE else {}
+
 
 # =========================
 # HELPER: Get context data
@@ -303,6 +598,40 @@ def get_context():
     return None
 
 
+# =========================
+# RENDER CONSTANTS
+# =========================
+_SIDEBAR_STEPS = {
+    'inbox': '1️⃣ Email Inbox',
+    'detail': '2️⃣ Email Detail',
+    'sourcing': '3️⃣ Supplier Selection',
+    'compliance': '4️⃣ Compliance Check',
+    'approval': '5️⃣ Approval Flow',
+    'order': '6️⃣ Order Confirmation',
+    'history': '📜 Process History'
+}
+
+_WORKFLOW_STATUS_MAP = {
+    WorkflowStatus.PENDING: ("⏸️", "Awaiting supplier"),
+    WorkflowStatus.IN_PROGRESS: ("▶️", "Running"),
+    WorkflowStatus.SUCCESS: ("✅", "Completed"),
+    WorkflowStatus.FAILED: ("❌", "Failed"),
+    WorkflowStatus.REQUIRES_APPROVAL: ("⚠️", "Needs approval"),
+} if ORCHESTRATOR_AVAILABLE else {}
+
+_HISTORY_EMOJI = {'success': "✅", 'warning': "⚠️", 'error': "❌"}
+
+
+# Preset reminder intervals -> label; the selectbox's format_func is a dict lookup
+REMINDER_INTERVALS = {
+    5: "5 minutes",
+    30: "30 minutes",
+    60: "1 hour(s)",
+    120: "2 hour(s)",
+    1440: "1 day",
+}
+
+
 # =========================
 # PAGE: INBOX
 # =========================
@@ -316,22 +645,50 @@ def page_inbox():
 
     if st.button("📧 Read and classify unread emails in Outlook", type="primary"):
         with st.spinner("Connecting to Outlook and classifying emails..."):
-            time.sleep(1)
+            # Extract all procurement requests concurrently up front
+            pending = PROCUREMENT_EMAILS
+            results = run_email_agents_concurrently([e.body for e in pending])
+            for email, result in zip(pending, results):
+                if result is not None:
+                    request, template = result
+                    st.session_state.extracted_requests[email.id] = request
+                    st.session_state.approval_templates[email.id] = template
             st.session_state.emails_loaded = True
 
     if st.session_state.emails_loaded:
         st.success("✅ Emails classified successfully!")
         st.markdown("### 📋 Category: Procurement Requests")
 
-        procurement_emails = [
-            e for e in MOCK_EMAILS if e.category == "Procurement Request"]
+        procurement_emails = PROCUREMENT_EMAILS
+
+        if st.button("⚡ Process all", help="Extract every request in a single LLM call"):
+            with st.spinner(f"Extracting {len(procurement_emails)} requests..."):
+                try:
+                    requests = run_email_agent_batch(
+                        [e.body for e in procurement_emails])
+                except Exception as e:
+                    st.error(f"❌ Batch extraction failed: {e}")
+                else:
+                    for email, request in zip(procurement_emails, requests):
+                        st.session_state.extracted_requests[email.id] = request
+                    add_history("📨 Email Agent",
+                                f"Batch extracted {len(requests)} requests", "success")
+                    st.dataframe(
+                        {
+                            "From": [e.sender for e in procurement_emails],
+                            "Item": [r.item for r in requests],
+                            "Quantity": [r.quantity for r in requests],
+                            "Budget (TL)": [r.budget for r in requests],
+                        },
+                        hide_index=True
+                    )
 
         for email in procurement_emails:
             with st.container():
                 col1, col2 = st.columns([4, 1])
 
                 with col1:
-                    priority_emoji = "🔴" if email.priority == "High" else "🟡" if email.priority == "Medium" else "🟢"
+                    priority_emoji = _PRIO_EMOJI.get(email.priority, "🟢")
                     st.markdown(f"**{priority_emoji} From:** {email.sender}")
                     st.markdown(f"**Subject:** {email.subject}")
 
@@ -354,7 +711,7 @@ def page_inbox():
                         with st.spinner("🤖 Orchestrator: Running Email Agent & Supplier Agent..."):
                             # Execute workflow - pauses at supplier selection (PENDING)
                             context = orchestrator.execute_workflow(email_data)
-                            st.session_state.workflow_context = context
+                            set_workflow_context(context)
 
                         # ✅ MD MADDE 3: Navigate based on workflow status
                         if context.workflow_status == WorkflowStatus.PENDING:
@@ -409,7 +766,7 @@ def page_sourcing():
         return
 
     request = ctx.purchase_request
-    suppliers = ctx.suppliers
+    pool = ctx.suppliers
 
     if st.button("← Back"):
         st.session_state.page = 'inbox'
@@ -429,18 +786,23 @@ def page_sourcing():
     st.markdown("### 🏢 Available Suppliers")
     st.caption("✨ Suppliers already found by Orchestrator's Sourcing Agent")
 
-    for idx, supplier in enumerate(suppliers):
-        total_cost = supplier.price_per_unit * request.quantity
-        compliance_badge = "✅ Compliant" if supplier.compliant else "❌ Non-compliant"
+    totals = pool.totals(request.quantity)
+    eligible = pool.eligible(request)
+
+    for idx in range(len(pool)):
+        compliance_badge = "✅ Compliant" if pool.compliant[idx] else "❌ Non-compliant"
+        if pool.compliant[idx] and not eligible[idx]:
+            compliance_badge += " (over budget)"
 
         with st.container():
             col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 2, 1])
-            col1.markdown(f"**{supplier.name}**")
-            col2.markdown(f"Unit: {supplier.price_per_unit} TL")
-            col3.markdown(f"Total: {total_cost} TL")
+            col1.markdown(f"**{pool.names[idx]}**")
+            col2.markdown(f"Unit: {pool.prices[idx]} TL")
+            col3.markdown(f"Total: {totals[idx]:.2f} TL")
             col4.markdown(compliance_badge)
 
             if col5.button("Select", key=f"supplier_{idx}"):
+                supplier = pool.supplier(idx)
 
                 # ✅ MD MADDE 3: Resume workflow with supplier selection
                 orchestrator = st.session_state.orchestrator
@@ -448,7 +810,7 @@ def page_sourcing():
                 with st.spinner("🤖 Orchestrator: Running Compliance Agent..."):
                     user_input = {'selected_supplier': supplier}
                     ctx = orchestrator.resume_workflow(ctx, user_input)
-                    st.session_state.workflow_context = ctx
+                    set_workflow_context(ctx)
 
                 # ✅ MD MADDE 3: Navigate based on workflow status
                 if ctx.workflow_status == WorkflowStatus.REQUIRES_APPROVAL:
@@ -467,6 +829,14 @@ def page_sourcing():
 # =========================
 # PAGE: APPROVAL
 # =========================
+# (widget key, approval_email field, default)
+_APPROVAL_FIELDS = (
+    ("edit_manager_email", "manager_email", "manager@greypine.com"),
+    ("edit_subject", "subject", "Approval Required"),
+    ("edit_body", "body", "Email body"),
+)
+
+
 def page_approval():
     """MD madde 3 & 4: Approval flow - orchestrator.resume_workflow() ile manager onayı"""
     st.title("📧 Email Agent - Approval Request")
@@ -489,23 +859,39 @@ def page_approval():
 
     st.divider()
     st.markdown("### 📨 Approval Email Preview")
+
+    if st.button("🔄 Regenerate with AI", disabled=st.session_state.approval_sent):
+        _, reason = ctx.compliance_result or (True, "Approval required")
+        # Tokens show up as they are generated instead of after the full reply
+        with st.container(border=True):
+            raw = st.write_stream(stream_approval(
+                ctx.purchase_request, ctx.selected_supplier, reason))
+        try:
+            approval = {**approval, **fast_parse(raw)}
+        except OutputParserException as e:
+            st.error(f"❌ Could not parse the generated email: {e}")
+        else:
+            ctx.approval_email = approval
+            set_workflow_context(ctx)
+            # Widgets below are not created yet in this run, so their state can be set
+            for key, field, default in _APPROVAL_FIELDS:
+                st.session_state[key] = approval.get(field, default)
+            add_history("📧 Approval Agent",
+                        f"Email regenerated: {approval.get('subject', 'N/A')}", "success")
+
+    # The edit widgets take their value from session state only (no value=),
+    # so a regenerated email can overwrite them without a Streamlit warning
+    for key, field, default in _APPROVAL_FIELDS:
+        st.session_state.setdefault(key, approval.get(field, default))
+
     st.markdown("#### ✏️ Edit Email Content")
 
-    manager_email = st.text_input(
-        "To:",
-        value=approval.get('manager_email', 'manager@greypine.com'),
-        key="edit_manager_email"
-    )
+    manager_email = st.text_input("To:", key="edit_manager_email")
 
-    subject = st.text_input(
-        "Subject:",
-        value=approval.get('subject', 'Approval Required'),
-        key="edit_subject"
-    )
+    subject = st.text_input("Subject:", key="edit_subject")
 
     body = st.text_area(
         "Email Body:",
-        value=approval.get('body', 'Email body'),
         height=200,
         key="edit_body"
     )
@@ -517,7 +903,7 @@ def page_approval():
             'subject': subject,
             'body': body
         }
-        st.session_state.workflow_context = ctx
+        set_workflow_context(ctx)
         st.success("✅ Email updated!")
         time.sleep(1)
         st.rerun()
@@ -534,7 +920,7 @@ def page_approval():
             'subject': subject,
             'body': body
         }
-        st.session_state.workflow_context = ctx
+        set_workflow_context(ctx)
         st.session_state.approval_sent = True
         st.rerun()
 
@@ -553,8 +939,8 @@ def page_approval():
 
         reminder_interval = st.selectbox(
             "Select reminder interval:",
-            options=[5, 30, 60, 120, 1440],
-            format_func=lambda x: f"{x} minutes" if x < 60 else f"{x//60} hour(s)" if x < 1440 else "1 day",
+            options=list(REMINDER_INTERVALS),
+            format_func=REMINDER_INTERVALS.__getitem__,
             index=2,
             key="reminder_interval_select"
         )
@@ -586,7 +972,7 @@ def page_approval():
                 # ✅ MD MADDE 3: Resume workflow with manager approval
                 user_input = {'manager_approved': True}
                 ctx = orchestrator.resume_workflow(ctx, user_input)
-                st.session_state.workflow_context = ctx
+                set_workflow_context(ctx)
 
             add_history("✅ Manager Approval",
                         "Request approved by manager", "success")
@@ -639,7 +1025,7 @@ def page_order():
     with st.expander("📋 Execution Log"):
         for log in ctx.execution_log:
             st.text(
-                f"🕐 {log['timestamp']} | {log['agent']:20s} | {log['status']}")
+                f"🕐 {log.timestamp} | {log.agent:20s} | {log.status}")
 
     st.divider()
 
@@ -660,7 +1046,7 @@ def page_order():
 
     if st.button("🔙 Return to Inbox", type="primary"):
         # Reset workflow context
-        st.session_state.workflow_context = None
+        set_workflow_context(None)
         st.session_state.approval_sent = False
         st.session_state.page = 'inbox'
         st.rerun()
@@ -692,6 +1078,12 @@ def page_history():
                     f"Interval: {reminder['interval']} | Status: ⏳ {reminder['status']}")
                 st.divider()
 
+    _history_list()
+
+
+@st.fragment
+def _history_list():
+    """Reruns on its own - Clear History doesn't re-execute the whole script"""
     history = st.session_state.history
 
     if not history:
@@ -701,29 +1093,76 @@ def page_history():
     st.markdown(f"### 📊 Total Actions: {len(history)}")
     st.divider()
 
-    for event in reversed(history):
-        if event['status'] == 'success':
-            emoji = "✅"
-        elif event['status'] == 'warning':
-            emoji = "⚠️"
-        elif event['status'] == 'error':
-            emoji = "❌"
-        else:
-            emoji = "🔵"
+    for event in history:
+        emoji = _HISTORY_EMOJI.get(event['status'], "🔵")
 
         with st.container():
             col1, col2, col3 = st.columns([1, 3, 6])
-            col1.markdown(f"**{event['timestamp']}**")
+            col1.markdown(
+                f"**{datetime.fromtimestamp(event['ts']).strftime('%H:%M:%S')}**")
             col2.markdown(f"{emoji} **{event['action']}**")
             col3.markdown(f"_{event['details']}_")
             st.divider()
 
     if st.button("🗑️ Clear History", type="secondary"):
-        st.session_state.history = []
-        st.success("History cleared!")
-        time.sleep(1)
+        st.session_state.history.clear()
+        st.toast("History cleared!")
+        st.rerun(scope="fragment")
+
+
+# =========================
+# SIDEBAR
+# =========================
+@st.fragment
+def _sidebar():
+    """Sidebar widgets rerun only this fragment; navigation still reruns the app"""
+    st.markdown("### 🤖 Procurement Assistant")
+    st.markdown("Powered by IBM watsonx Orchestrate")
+    st.divider()
+
+    if st.button("📜 View History", use_container_width=True):
+        st.session_state.page = 'history'
         st.rerun()
 
+    st.divider()
+
+    current_step = _SIDEBAR_STEPS.get(st.session_state.page, 'Unknown')
+    st.info(f"**Current Step:**\n{current_step}")
+
+    # Metrics
+    history_count = len(st.session_state.get('history', []))
+    reminder_count = len(st.session_state.get('scheduled_reminders', []))
+    col1, col2 = st.columns(2)
+    if history_count > 0:
+        col1.metric("Actions", history_count)
+    if reminder_count > 0:
+        col2.metric("⏰ Reminders", reminder_count)
+
+    # ✅ MD MADDE 5: Orchestrator Monitoring UI
+    ctx = st.session_state.get('workflow_context')
+    if ctx and ORCHESTRATOR_AVAILABLE:
+        st.divider()
+        st.markdown("### 🤖 Orchestrator Status")
+
+        emoji, label = _WORKFLOW_STATUS_MAP.get(
+            ctx.workflow_status, ("❓", "Unknown"))
+
+        st.markdown(f"**Status:** {emoji} {label}")
+
+        if ctx.current_step:
+            st.markdown(f"**Last Agent:** `{ctx.current_step}`")
+
+        agents_run = len(ctx.execution_log)
+        if agents_run > 0:
+            st.metric("Agents Executed", agents_run)
+
+        # Execution log in expander
+        if ctx.execution_log:
+            with st.expander("📋 Execution Log"):
+                for log in ctx.execution_log:
+                    st.text(
+                        f"{log.timestamp} {log.agent}: {log.status}")
+
 
 # =========================
 # MAIN ROUTER
@@ -734,69 +1173,7 @@ def main():
 
     # ✅ MD MADDE 5: Sidebar - Orchestrator Monitoring
     with st.sidebar:
-        st.markdown("### 🤖 Procurement Assistant")
-        st.markdown("Powered by IBM watsonx Orchestrate")
-        st.divider()
-
-        if st.button("📜 View History", use_container_width=True):
-            st.session_state.page = 'history'
-            st.rerun()
-
-        st.divider()
-
-        steps = {
-            'inbox': '1️⃣ Email Inbox',
-            'detail': '2️⃣ Email Detail',
-            'sourcing': '3️⃣ Supplier Selection',
-            'compliance': '4️⃣ Compliance Check',
-            'approval': '5️⃣ Approval Flow',
-            'order': '6️⃣ Order Confirmation',
-            'history': '📜 Process History'
-        }
-
-        current_step = steps.get(st.session_state.page, 'Unknown')
-        st.info(f"**Current Step:**\n{current_step}")
-
-        # Metrics
-        history_count = len(st.session_state.get('history', []))
-        reminder_count = len(st.session_state.get('scheduled_reminders', []))
-        col1, col2 = st.columns(2)
-        if history_count > 0:
-            col1.metric("Actions", history_count)
-        if reminder_count > 0:
-            col2.metric("⏰ Reminders", reminder_count)
-
-        # ✅ MD MADDE 5: Orchestrator Monitoring UI
-        ctx = st.session_state.get('workflow_context')
-        if ctx and ORCHESTRATOR_AVAILABLE:
-            st.divider()
-            st.markdown("### 🤖 Orchestrator Status")
-
-            status_map = {
-                WorkflowStatus.PENDING: ("⏸️", "Awaiting supplier"),
-                WorkflowStatus.IN_PROGRESS: ("▶️", "Running"),
-                WorkflowStatus.SUCCESS: ("✅", "Completed"),
-                WorkflowStatus.FAILED: ("❌", "Failed"),
-                WorkflowStatus.REQUIRES_APPROVAL: ("⚠️", "Needs approval"),
-            }
-            emoji, label = status_map.get(
-                ctx.workflow_status, ("❓", "Unknown"))
-
-            st.markdown(f"**Status:** {emoji} {label}")
-
-            if ctx.current_step:
-                st.markdown(f"**Last Agent:** `{ctx.current_step}`")
-
-            agents_run = len(ctx.execution_log)
-            if agents_run > 0:
-                st.metric("Agents Executed", agents_run)
-
-            # Execution log in expander
-            if ctx.execution_log:
-                with st.expander("📋 Execution Log"):
-                    for log in ctx.execution_log:
-                        st.text(
-                            f"{log['timestamp']} {log['agent']}: {log['status']}")
+        _sidebar()
 
     # Page routing
     page = st.session_state.page